@@ -0,0 +1,342 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+# Headless radiographies and tomographies, without GUI. It can be launched
+# either with the FreeCAD python modules in the PYTHONPATH,
+#
+#     python -m freecad.xray.Batch scan.FCStd --machine XRay ct out/
+#
+# or within FreeCADCmd,
+#
+#     FreeCADCmd -c "import sys; from freecad.xray import Batch; \
+#                    sys.exit(Batch.main(['scan.FCStd', 'ct', 'out/']))"
+#
+# The progress is reported as JSON lines on the standard output. Anything
+# else printed meanwhile, by FreeCAD, LuxCore or the workbench, goes to the
+# standard error
+
+
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import numpy as np
+
+
+MODES = ['radiography', 'ct']
+# The default power, as a function of the light area
+SPECIFIC_POWER = '1000 W/m^2'
+# Exit codes
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+EXIT_NOT_FOUND = 3
+EXIT_STOPPED = 4
+# The stream the events are written on, see json_output()
+EVENTS = None
+
+
+def report(event, **kwargs):
+    """Writes an event on the standard output, as a JSON line
+
+    Keyword arguments:
+    event -- The event name, like 'start', 'progress', 'output' or 'error'
+    kwargs -- The event data
+    """
+    kwargs.update({'event': event, 'time': time.time()})
+    stream = EVENTS or sys.stdout
+    stream.write(json.dumps(kwargs) + '\n')
+    stream.flush()
+
+
+@contextlib.contextmanager
+def json_output():
+    """Context where the standard output is reserved to the report() events.
+    The output file descriptor itself is redirected to the standard error,
+    so the messages of the native libraries, like the FreeCAD console or
+    LuxCore, are redirected as well
+    """
+    global EVENTS
+    sys.stdout.flush()
+    saved = os.dup(1)
+    EVENTS = os.fdopen(os.dup(saved), 'w')
+    os.dup2(2, 1)
+    stdout, sys.stdout = sys.stdout, sys.stderr
+    try:
+        yield EVENTS
+    finally:
+        sys.stdout = stdout
+        os.dup2(saved, 1)
+        os.close(saved)
+        EVENTS.close()
+        EVENTS = None
+
+
+def parser():
+    """Returns the command line arguments parser
+
+    Returns:
+    The argparse.ArgumentParser
+    """
+    from .xrayRadiography.Tools import ENGINES, PROFILES
+    from .xrayCT.Reconstruction import METHODS
+    from .xrayCT.Tools import ORDERS
+    p = argparse.ArgumentParser(
+        prog='freecad.xray.Batch',
+        description='Headless X-Ray radiographies and tomographies',
+        epilog='The outputs are stacks of images: radiography.npy is '
+               '(rows, columns), sinogram.npy is (angles, rows, columns) '
+               'and tomography.npy is (Z, X, Y)')
+    p.add_argument('document', help='The FreeCAD document')
+    p.add_argument('mode', choices=MODES, help='What to compute')
+    p.add_argument('output', help='The output folder')
+    p.add_argument('--machine', default=None,
+                   help='Name or label of the X-Ray machine. It can be '
+                        'omitted if there is just one')
+    p.add_argument('--angle', type=float, default=0.0,
+                   help='Radiography angle, in degrees')
+    p.add_argument('--angles', type=int, default=180,
+                   help='Number of tomography projections')
+    p.add_argument('--max-error', default='0.2',
+                   help='Maximum admissible error')
+    p.add_argument('--power', default=None,
+                   help='Emitter power, e.g. "100 W". By default {} of '
+                        'the light area'.format(SPECIFIC_POWER))
+    p.add_argument('--engine', choices=ENGINES, default='luxcore')
+    p.add_argument('--gpu', action='store_true', help='Render on the GPU')
+    p.add_argument('--spectral-error', type=float, default=0.0,
+                   help='Error budget of the adaptive spectral bins, which '
+                        'require less renders. 0 for uniform bins')
+    p.add_argument('--profile', choices=sorted(PROFILES), default='full',
+                   help='LuxCore render profile. "primary" just renders '
+                        'the unscattered beam, a faster approximation '
+                        'which ignores the scatter')
+    p.add_argument('--threads', type=int, default=0,
+                   help='Number of render threads, 0 for all')
+    p.add_argument('--seeds', type=int, default=1,
+                   help='Number of radiography render processes, each one '
+                        'with a different seed, whose films are merged')
+    p.add_argument('--processes', type=int, default=1,
+                   help='Number of tomography render processes')
+    p.add_argument('--method', choices=METHODS, default='fbp',
+                   help='Tomography reconstruction method')
+    p.add_argument('--order', choices=ORDERS, default='golden',
+                   help='Tomography projections rendering order')
+    return p
+
+
+def find_machine(doc, name=None):
+    """Looks for an X-Ray machine in a document
+
+    Keyword arguments:
+    doc -- The FreeCAD document
+    name -- The machine name or label. None to get the only one
+
+    Returns:
+    The machine, None if it cannot be found or it is ambiguous
+    """
+    from .xrayUtils.Selection import get_xrays
+    if name is None:
+        xrays = get_xrays(doc.Objects)
+        return xrays[0] if len(xrays) == 1 else None
+    objs = [doc.getObject(name)] + doc.getObjectsByLabel(name)
+    xrays = get_xrays([obj for obj in objs if obj is not None])
+    return xrays[0] if xrays else None
+
+
+def radiography(xray, angle, e, power, output, **kwargs):
+    """Computes a radiography, saving it as radiography.npy and
+    radiography.png
+
+    Keyword arguments:
+    xray -- The X-Ray machine
+    angle -- The angle, in degrees
+    e -- Maximum admissible error
+    power -- The emitter power
+    output -- The output folder
+    kwargs -- Any other xrayRadiography.Tools.radiography() argument
+
+    Returns:
+    True if the radiography was computed, False otherwise
+    """
+    from FreeCAD import Units
+    from .xrayRadiography import Tools
+    from .xrayRadiography.PlotAux import save_image
+    from .xrayUtils import Monitor
+
+    bins = kwargs.get('bins', None) or Tools.spectral_bins(xray)
+    n = len(bins) // 3 + 1
+    samples = []
+    sessions = Tools.radiography(xray, angle * Units.Degree, e, power,
+                                 **kwargs)
+    for i, (folder, session) in enumerate(sessions):
+        last = {'conv': None}
+
+        def progress(step, conv):
+            if int(100 * conv) != last['conv']:
+                last['conv'] = int(100 * conv)
+                report('progress', stage='radiography', index=i, total=n,
+                       convergence=conv)
+
+        if not Monitor.wait(session, on_progress=progress):
+            return False
+        imgs = Tools.get_imgs(folder, session)
+        session.Stop()
+        if i == 0:
+            # For the background image we just need one channels
+            imgs = [imgs[0]]
+        samples = samples + imgs
+        report('progress', stage='radiography', index=i, total=n,
+               convergence=1.0)
+
+    img = Tools.assemble_radiography(xray, samples, bins=bins)
+    fname = os.path.join(output, 'radiography.npy')
+    np.save(fname, img)
+    report('output', file=fname)
+    fname = save_image(output, img)
+    if fname is not None:
+        report('output', file=fname)
+    return True
+
+
+def ct(xray, n, e, power, output, method='fbp', **kwargs):
+    """Computes a tomography, saving the sinogram.npy and tomography.npy
+    arrays. They are saved in their storage order, i.e. (angles, rows,
+    columns) and (Z, X, Y). See xrayCT.Tools.SINO_AXES and VOLUME_AXES
+
+    Keyword arguments:
+    xray -- The X-Ray machine
+    n -- Number of projections
+    e -- Maximum admissible error
+    power -- The emitter power
+    output -- The output folder
+    method -- The reconstruction method, see xrayCT.Reconstruction.METHODS
+    kwargs -- Any other xrayCT.Tools.sinogram() argument
+
+    Returns:
+    True if the tomography was computed, False otherwise
+    """
+    from .xrayCT import Tools, Reconstruction
+
+    done = set()
+
+    def on_projection(i, sino):
+        done.add(i)
+        report('progress', stage='sinogram', index=i, done=len(done),
+               total=n)
+
+    sino = None
+    # The projections are saved on the output folder as well, so the scan
+    # is resumed if the process is launched again
+    for sino in Tools.sinogram(xray, n, e, power, storage=output,
+                               on_projection=on_projection, scan_dir=output,
+                               **kwargs):
+        pass
+    if len(done) < n:
+        return False
+    report('output', file=os.path.join(output, 'sinogram.npy'))
+
+    total = -(-xray.SensorResolutionY // Reconstruction.BLOCK)
+    i = 0
+    for i, _ in enumerate(Tools.tomography(xray, sino, storage=output,
+                                           method=method)):
+        report('progress', stage='tomography', index=i, done=i + 1,
+               total=total)
+    if i + 1 < total:
+        return False
+    report('output', file=os.path.join(output, 'tomography.npy'))
+    return True
+
+
+def main(argv=None):
+    """Runs the batch process
+
+    Keyword arguments:
+    argv -- The command line arguments. None for sys.argv[1:]
+
+    Returns:
+    The exit code
+    """
+    try:
+        args = parser().parse_args(argv)
+    except SystemExit as e:
+        return EXIT_USAGE if e.code else EXIT_OK
+
+    with json_output():
+        return run(args)
+
+
+def run(args):
+    """Runs the batch process, reporting the events
+
+    Keyword arguments:
+    args -- The parsed command line arguments. See parser()
+
+    Returns:
+    The exit code
+    """
+    try:
+        import FreeCAD as App
+        from FreeCAD import Units
+        doc = App.openDocument(os.path.abspath(args.document))
+        xray = find_machine(doc, args.machine)
+        if xray is None:
+            report('error', message='X-Ray machine not found')
+            return EXIT_NOT_FOUND
+        os.makedirs(args.output, exist_ok=True)
+        e = Units.parseQuantity(args.max_error)
+        if args.power is None:
+            area = xray.ChamberRadius * xray.ChamberHeight
+            power = Units.parseQuantity(SPECIFIC_POWER) * area
+        else:
+            power = Units.parseQuantity(args.power)
+        report('start', mode=args.mode, document=args.document,
+               machine=xray.Name)
+        from .xrayRadiography.Tools import select_bins
+        options = {'use_gpu': args.gpu, 'engine': args.engine,
+                   'threads': args.threads, 'profile': args.profile,
+                   'bins': select_bins(xray, args.spectral_error)}
+        if args.mode == 'radiography':
+            ok = radiography(xray, args.angle, e, power, args.output,
+                             seeds=args.seeds, **options)
+        else:
+            ok = ct(xray, args.angles, e, power, args.output,
+                    method=args.method, processes=args.processes,
+                    order=args.order, **options)
+    except KeyboardInterrupt:
+        report('error', message='Interrupted')
+        return EXIT_STOPPED
+    except Exception as e:
+        report('error', message='{}: {}'.format(type(e).__name__, e))
+        return EXIT_ERROR
+
+    if not ok:
+        report('error', message='Stopped')
+        return EXIT_STOPPED
+    report('done')
+    return EXIT_OK
+
+
+if __name__ == '__main__':
+    sys.exit(main())
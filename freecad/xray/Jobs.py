@@ -0,0 +1,351 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+# Persistent queue of headless radiography and CT jobs, run as Batch
+# processes with a limited concurrency. The queue state is kept on disk, so
+# the unfinished jobs are resumed after a crash or restart, e.g.
+#
+#     python -m freecad.xray.Jobs queue/ add scan.FCStd ct out/ --angles 90
+#     python -m freecad.xray.Jobs queue/ run --concurrency 2
+
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import subprocess
+from .xrayUtils import Files, Processes
+
+
+STATES = ['pending', 'running', 'done', 'failed', 'stopped']
+INDEX = "jobs.json"
+LOCK = "jobs.lock"
+# Seconds between the running jobs checks
+POLL_INTERVAL = 0.5
+# Seconds between the renewals of the running jobs heartbeat, and seconds
+# without renewal after which the runner of a job is considered dead
+HEARTBEAT_INTERVAL = 5.0
+LEASE = 60.0
+
+
+def options_argv(**options):
+    """Converts keyword options to Batch command line arguments
+
+    Keyword arguments:
+    options -- The options, like angles=90 or max_error='0.1'. The booleans
+               are flags, and the None values are ignored
+
+    Returns:
+    The list of arguments
+    """
+    argv = []
+    for key, value in sorted(options.items()):
+        flag = '--' + key.replace('_', '-')
+        if value is None or value is False:
+            continue
+        elif value is True:
+            argv.append(flag)
+        else:
+            argv += [flag, str(value)]
+    return argv
+
+
+class Queue:
+    def __init__(self, folder):
+        """Jobs queue persisted on a folder, which is created if it does
+        not exist yet. Several processes can add, list and run the jobs of
+        the same queue at once
+
+        Keyword arguments:
+        folder -- The queue folder
+        """
+        self.folder = os.path.abspath(folder)
+        os.makedirs(self.folder, exist_ok=True)
+        # Identifies the jobs claimed by this queue instance
+        self.runner = uuid.uuid4().hex[:12]
+        self.jobs = self.__load()
+
+    def __load(self):
+        try:
+            with open(os.path.join(self.folder, INDEX), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def __save(self):
+        with Files.atomic_file(os.path.join(self.folder, INDEX), 'w') as f:
+            json.dump(self.jobs, f, indent=1)
+
+    def update(self, func):
+        """Modifies the queue, reloading it from disk and saving it back
+        while the other processes are locked out
+
+        Keyword arguments:
+        func -- Function called with the list of jobs, to modify them in
+                place
+
+        Returns:
+        The value returned by func
+        """
+        with Files.lock(os.path.join(self.folder, LOCK)):
+            self.jobs = self.__load()
+            result = func(self.jobs)
+            self.__save()
+        return result
+
+    def reload(self):
+        """Reads the queue state from disk
+
+        Returns:
+        The list of jobs
+        """
+        self.jobs = self.__load()
+        return self.jobs
+
+    def add(self, document, mode, output, **options):
+        """Adds a job at the end of the queue
+
+        Keyword arguments:
+        document -- The FreeCAD document
+        mode -- One of Batch.MODES
+        output -- The output folder
+        options -- Any other Batch option, like machine, angles, power,
+                   max_error or engine
+
+        Returns:
+        The job id
+        """
+        from . import Batch
+        argv = [os.path.abspath(document), mode, os.path.abspath(output)]
+        argv += options_argv(**options)
+        # Fail now, instead of when the job is launched
+        Batch.parser().parse_args(argv)
+        job = {'id': uuid.uuid4().hex[:12],
+               'argv': argv,
+               'state': 'pending',
+               'attempts': 0,
+               'returncode': None,
+               'log': None,
+               'runner': None,
+               'heartbeat': None}
+        self.update(lambda jobs: jobs.append(job))
+        return job['id']
+
+    def add_argv(self, argv):
+        """Adds a job at the end of the queue, from the Batch command line
+        arguments
+
+        Keyword arguments:
+        argv -- The Batch arguments
+
+        Returns:
+        The job id
+        """
+        from . import Batch
+        p = Batch.parser()
+        args = vars(p.parse_args(argv))
+        positional = [args.pop(k) for k in ('document', 'mode', 'output')]
+        defaults = vars(p.parse_args(positional))
+        options = {k: v for k, v in args.items() if v != defaults[k]}
+        return self.add(*positional, **options)
+
+    def resume(self):
+        """Sets back the jobs interrupted by stop(), or by a crash of their
+        runner, as pending. The jobs of the runners still alive are not
+        touched"""
+        def resume(jobs):
+            now = time.time()
+            for job in jobs:
+                if job['state'] == 'stopped' or (
+                        job['state'] == 'running' and
+                        now - (job.get('heartbeat') or 0) > LEASE):
+                    job['state'] = 'pending'
+        self.update(resume)
+
+    def __claim(self, n):
+        # Marks up to n pending jobs as run by this queue instance
+        def claim(jobs):
+            claimed = []
+            for job in jobs:
+                if len(claimed) >= n:
+                    break
+                if job['state'] != 'pending':
+                    continue
+                job.update({'state': 'running',
+                            'attempts': job['attempts'] + 1,
+                            'log': os.path.join(self.folder,
+                                                job['id'] + '.log'),
+                            'runner': self.runner,
+                            'heartbeat': time.time()})
+                claimed.append(dict(job))
+            return claimed
+        return self.update(claim) if n > 0 else []
+
+    def __set_states(self, states):
+        # Sets the state and return code of the jobs claimed by this queue
+        # instance, by id, renewing the heartbeat of the still running ones
+        def set_states(jobs):
+            changed = []
+            for job in jobs:
+                if job.get('runner') != self.runner or \
+                        job['state'] != 'running':
+                    continue
+                job['heartbeat'] = time.time()
+                if job['id'] in states:
+                    job['state'], job['returncode'] = states[job['id']]
+                    changed.append(dict(job))
+            return changed
+        return self.update(set_states)
+
+    def __launch(self, job):
+        env = dict(os.environ)
+        # The FreeCAD modules are not necessarily in the default path
+        env['PYTHONPATH'] = os.pathsep.join([p for p in sys.path if p])
+        log = open(job['log'], 'a')
+        try:
+            return subprocess.Popen(
+                [Processes.python_executable(), '-m', 'freecad.xray.Batch'] +
+                job['argv'], stdout=log, stderr=subprocess.STDOUT, env=env)
+        finally:
+            log.close()
+
+    def run(self, concurrency=1, on_change=None):
+        """Runs the pending jobs, until all of them are finished. Several
+        runners can work on the same queue, each job being claimed by just
+        one of them
+
+        Keyword arguments:
+        concurrency -- Maximum number of simultaneous jobs
+        on_change -- Function called with each job whose state changes.
+                     None to ignore them
+
+        Returns:
+        The number of failed jobs
+        """
+        from .Batch import EXIT_OK, EXIT_STOPPED
+        on_change = on_change or (lambda job: None)
+        self.resume()
+        running = {}
+        last_beat = time.time()
+        try:
+            while True:
+                for job in self.__claim(concurrency - len(running)):
+                    try:
+                        running[job['id']] = self.__launch(job)
+                    except OSError:
+                        failed = {job['id']: ('failed', None)}
+                        for changed in self.__set_states(failed):
+                            on_change(changed)
+                        continue
+                    on_change(job)
+                if not running:
+                    break
+                time.sleep(POLL_INTERVAL)
+                states = {}
+                for job_id, process in list(running.items()):
+                    code = process.poll()
+                    if code is None:
+                        continue
+                    del running[job_id]
+                    if code == EXIT_OK:
+                        states[job_id] = ('done', code)
+                    elif code == EXIT_STOPPED:
+                        states[job_id] = ('stopped', code)
+                    else:
+                        states[job_id] = ('failed', code)
+                if states or time.time() - last_beat > HEARTBEAT_INTERVAL:
+                    last_beat = time.time()
+                    for job in self.__set_states(states):
+                        on_change(job)
+        finally:
+            # Stop the running jobs, which are resumed on the next run
+            for process in running.values():
+                process.terminate()
+                process.wait()
+            if running:
+                self.__set_states({job_id: ('stopped', None)
+                                   for job_id in running})
+        return len([j for j in self.reload() if j['state'] == 'failed'])
+
+    def retry(self):
+        """Sets back the failed jobs as pending"""
+        def retry(jobs):
+            for job in jobs:
+                if job['state'] == 'failed':
+                    job['state'] = 'pending'
+        self.update(retry)
+
+    def clear(self, states=('done',)):
+        """Removes the jobs in some states from the queue
+
+        Keyword arguments:
+        states -- The states of the removed jobs
+        """
+        def clear(jobs):
+            jobs[:] = [j for j in jobs if j['state'] not in states]
+        self.update(clear)
+
+
+def main(argv=None):
+    """Manages a jobs queue from the command line
+
+    Keyword arguments:
+    argv -- The command line arguments. None for sys.argv[1:]
+
+    Returns:
+    The exit code
+    """
+    p = argparse.ArgumentParser(prog='freecad.xray.Jobs',
+                                description='X-Ray jobs queue')
+    p.add_argument('queue', help='The queue folder')
+    sub = p.add_subparsers(dest='command', required=True)
+    add = sub.add_parser('add', help='Add a job, with the Batch arguments')
+    add.add_argument('args', nargs=argparse.REMAINDER)
+    run = sub.add_parser('run', help='Run the pending jobs')
+    run.add_argument('--concurrency', type=int, default=1)
+    sub.add_parser('list', help='List the jobs')
+    sub.add_parser('retry', help='Set the failed jobs as pending')
+    sub.add_parser('clear', help='Remove the finished jobs')
+    args = p.parse_args(argv)
+
+    queue = Queue(args.queue)
+    if args.command == 'add':
+        print(queue.add_argv(args.args))
+    elif args.command == 'run':
+        def on_change(job):
+            print(json.dumps({'id': job['id'], 'state': job['state']}))
+            sys.stdout.flush()
+        return 1 if queue.run(args.concurrency, on_change=on_change) else 0
+    elif args.command == 'list':
+        for job in queue.reload():
+            print(json.dumps(job))
+    elif args.command == 'retry':
+        queue.retry()
+    elif args.command == 'clear':
+        queue.clear()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -22,12 +22,18 @@
 
 import time
 import math
+import collections
+import numpy as np
 from PySide import QtGui, QtCore
 import FreeCAD
 import FreeCADGui
 from FreeCAD import Base, Vector, Units
 import Part
-from .xrayUtils import LightUnits
+from .xrayUtils import LightUnits, Attenuation
+
+
+# Number of sets of bins whose averaged attenuations are kept
+MU_CACHE_SIZE = 8
 
 
 def add_xray_obj_props(obj):
@@ -110,6 +116,8 @@ class XRayObj:
             (dens * v).getValueAs('m^-1').Value for v in attenuations]
         # obj.Shape = None
         obj.Proxy = self
+        self.table = None
+        self.mu_cache = collections.OrderedDict()
 
     def onChanged(self, fp, prop):
         """Detects the ship data changes.
@@ -118,7 +126,72 @@ class XRayObj:
         fp -- Part::FeaturePython object affected.
         prop -- Modified property name.
         """
-        pass
+        if prop in ["AttenuationFreqs", "AttenuationValues"]:
+            self.table = None
+            self.mu_cache = collections.OrderedDict()
+
+    def __getstate__(self):
+        """The attenuation tables are not saved, but computed on demand."""
+        return None
+
+    def __setstate__(self, state):
+        """Nothing was saved, so nothing needs to be done here."""
+        return None
+
+    def attenuation_table(self, fp, scale='m'):
+        """Returns the attenuation table as plain float arrays. The table is
+        built just once, and kept until the attenuation values change.
+
+        Keyword arguments:
+        fp -- Part::FeaturePython object.
+        scale -- The length units of the attenuation values.
+
+        Returns:
+        The energies (keV) and the attenuations (scale^-1) arrays.
+        """
+        if getattr(self, 'table', None) is None:
+            self.table = {}
+        if scale not in self.table:
+            kev = LightUnits.to_energy(
+                Units.parseQuantity('1 THz')).getValueAs('keV').Value
+            inv_len = Units.parseQuantity('1 m^-1').getValueAs(
+                scale + '^-1').Value
+            e = kev * np.asarray(fp.AttenuationFreqs, dtype=np.float64)
+            mu = inv_len * np.asarray(fp.AttenuationValues, dtype=np.float64)
+            order = np.argsort(e)
+            self.table[scale] = (e[order], mu[order])
+        return self.table[scale]
+
+    def average_mu(self, fp, bins, scale='m', num=25):
+        """Averaged attenuations on a set of energy bins. The attenuations
+        are interpolated in log-log scale, see Attenuation.average(). The
+        results of the last MU_CACHE_SIZE sets of bins are kept until the
+        attenuation values change.
+
+        Keyword arguments:
+        fp -- Part::FeaturePython object.
+        bins -- List of bins, as tuples with the minimum and maximum
+        energies (keV), and optionally any other item.
+        scale -- The length units of the attenuation values.
+        num -- Number of integration points on each bin.
+
+        Returns:
+        The array of averaged attenuations (scale^-1), one per bin.
+        """
+        key = (scale, num, tuple([(b[0], b[1]) for b in bins]))
+        if getattr(self, 'mu_cache', None) is None:
+            self.mu_cache = collections.OrderedDict()
+        if key in self.mu_cache:
+            self.mu_cache.move_to_end(key)
+            return self.mu_cache[key]
+        ep, mup = self.attenuation_table(fp, scale)
+        mu = Attenuation.average(ep, mup, bins, num=num)
+        self.mu_cache[key] = mu
+        # The adaptive spectral bins change with the scanned objects, so
+        # just the most recently used ones are kept
+        while len(self.mu_cache) > MU_CACHE_SIZE:
+            self.mu_cache.popitem(last=False)
+        return mu
 
     def execute(self, fp):
         """Detects the entity recomputations.
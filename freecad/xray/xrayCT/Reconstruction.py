@@ -0,0 +1,961 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+# Filtered back-projection of many slices at once. The sinograms are
+# (n_angles, n_det, n_slices) arrays, and the results are the ones
+# skimage.transform.iradon(..., circle=True, filter_name='ramp') is
+# computing slice by slice, but on the outermost ring of pixels when n_det is
+# even. iradon interpolates them with the filtered projections beyond the
+# detector edge, while here nothing is backprojected from outside the
+# detector.
+# This module does not depend on FreeCAD or the GUI, so it can be used on
+# worker processes
+
+
+import os
+import json
+import threading
+import collections
+import concurrent.futures
+import numpy as np
+
+
+POOLS = ['thread', 'process']
+METHODS = ['fbp', 'sirt', 'sart']
+# The orders the projections can be rendered in, see acquisition_order()
+ORDERS = ['linear', 'golden', 'bit-reversal']
+GOLDEN = 0.5 * (np.sqrt(5.0) - 1.0)
+# Default number of slices reconstructed at once
+BLOCK = 8
+# Maximum size of the backprojection weights kept by a plan, in bytes
+MAX_WEIGHTS = 512 * 1024 * 1024
+# Plans already loaded, by folder
+PLANS = {}
+# Dual iterations and step of the total variation denoising. The step shall
+# not exceed 1 / 8 for the iterations to converge
+TV_STEPS = 20
+TV_TAU = 0.125
+
+
+def acquisition_order(n, order='linear'):
+    """Order to render the projections in. With the golden and bit-reversal
+    orders any set of first projections is evenly spread along the scan
+
+    Keyword arguments:
+    n -- Number of projections
+    order -- One of ORDERS
+
+    Returns:
+    The projection indexes, in rendering order
+    """
+    if order == 'linear':
+        return list(range(n))
+    elif order == 'golden':
+        # Each projection is placed at the golden ratio fraction of the
+        # previous one, snapped to the evenly spaced angles
+        fractions = np.mod(np.arange(n) * GOLDEN, 1.0)
+        return [int(i) for i in np.argsort(np.argsort(fractions,
+                                                     kind='stable'))]
+    elif order == 'bit-reversal':
+        bits = max(int(np.ceil(np.log2(max(n, 1)))), 1)
+        indexes = [int('{:0{}b}'.format(i, bits)[::-1], 2)
+                   for i in range(2 ** bits)]
+        return [i for i in indexes if i < n]
+    raise ValueError('Unknown order "{}"'.format(order))
+
+
+def padded_size(n_det):
+    """Size of the zero padded projections for the FFT
+
+    Keyword arguments:
+    n_det -- Number of detector pixels
+
+    Returns:
+    The padded size
+    """
+    return max(64, int(2 ** np.ceil(np.log2(2 * n_det))))
+
+
+def ramp_filter(size):
+    """The ramp filter in the frequency domain
+
+    Keyword arguments:
+    size -- The padded projections size
+
+    Returns:
+    The filter (size,) array
+    """
+    n = np.concatenate((np.arange(1, size / 2 + 1, 2, dtype=int),
+                        np.arange(size / 2 - 1, 0, -2, dtype=int)))
+    f = np.zeros(size)
+    f[0] = 0.25
+    f[1::2] = -1 / (np.pi * n) ** 2
+    return 2 * np.real(np.fft.fft(f))
+
+
+def filter_sinogram(sino, fourier_filter=None):
+    """Filters all the sinogram rows in a single batched FFT
+
+    Keyword arguments:
+    sino -- (n_angles, n_det, n_slices) sinogram
+    fourier_filter -- The filter, see ramp_filter(). None to build it
+
+    Returns:
+    The filtered (n_angles, n_det, n_slices) sinogram
+    """
+    n_det = sino.shape[1]
+    size = padded_size(n_det)
+    if fourier_filter is None:
+        fourier_filter = ramp_filter(size)
+    # The filter is real and symmetric, so the real FFT is enough
+    f = fourier_filter[:size // 2 + 1]
+    projection = np.fft.rfft(sino, n=size, axis=1) * f[np.newaxis, :,
+                                                       np.newaxis]
+    return np.fft.irfft(projection, n=size, axis=1)[:, :n_det, :]
+
+
+def interp_weights(angle, n_det):
+    """Linear interpolation indexes and weights to backproject a projection
+
+    Keyword arguments:
+    angle -- The projection angle, in degrees
+    n_det -- Number of detector pixels
+
+    Returns:
+    The (n_det, n_det) arrays of the lower detector index of each pixel,
+    the weight of the upper one, and whether the pixel is seen by the
+    detector at all
+    """
+    radius = n_det // 2
+    xpr, ypr = np.mgrid[:n_det, :n_det] - radius
+    a = np.deg2rad(angle)
+    idx = ypr * np.cos(a) - xpr * np.sin(a) + radius
+    valid = (idx >= 0) & (idx <= n_det - 1)
+    i0 = np.clip(np.floor(idx), 0, max(n_det - 2, 0)).astype(np.intp)
+    w1 = np.where(valid, idx - i0, 0.0)
+    return i0, w1, valid
+
+
+def circle_mask(n_det):
+    """Pixels out of the reconstruction circle
+
+    Keyword arguments:
+    n_det -- Number of detector pixels
+
+    Returns:
+    The (n_det, n_det) boolean mask
+    """
+    radius = n_det // 2
+    xpr, ypr = np.mgrid[:n_det, :n_det] - radius
+    return (xpr ** 2 + ypr ** 2) > radius ** 2
+
+
+def backproject(filtered, angles, weights=None):
+    """Backprojects all the slices at once
+
+    Keyword arguments:
+    filtered -- (n_angles, n_det, n_slices) filtered sinogram
+    angles -- The projection angles, in degrees
+    weights -- The interp_weights() of each angle. None to compute them
+
+    Returns:
+    The (n_det, n_det, n_slices) reconstruction
+    """
+    n_angles, n_det, n_slices = filtered.shape
+    # A trailing zero so the upper index is always valid
+    padded = np.concatenate(
+        (filtered, np.zeros((n_angles, 1, n_slices), dtype=filtered.dtype)),
+        axis=1)
+    out = np.zeros((n_det, n_det, n_slices), dtype=np.float64)
+    for i, angle in enumerate(angles):
+        if weights is None:
+            i0, w1, valid = interp_weights(angle, n_det)
+        else:
+            i0, w1, valid = weights[i]
+        col = padded[i]
+        w1 = w1[..., np.newaxis]
+        out += np.where(valid[..., np.newaxis],
+                        col[i0] * (1.0 - w1) + col[i0 + 1] * w1,
+                        0.0)
+    out[circle_mask(n_det)] = 0.0
+    return out * np.pi / (2 * n_angles)
+
+
+def fbp(sino, angles):
+    """Filtered back-projection of a block of slices
+
+    Keyword arguments:
+    sino -- (n_angles, n_det, n_slices) sinogram
+    angles -- The projection angles, in degrees
+
+    Returns:
+    The (n_det, n_det, n_slices) reconstruction
+    """
+    return backproject(filter_sinogram(np.asarray(sino)), angles)
+
+
+class Plan:
+    def __init__(self, angles, n_det, max_weights=MAX_WEIGHTS):
+        """Precomputed filter, circle mask and backprojection weights, so
+        they can be reused to reconstruct many slices and sinograms with
+        the same geometry
+
+        Keyword arguments:
+        angles -- The projection angles, in degrees
+        n_det -- Number of detector pixels
+        max_weights -- Maximum size of the weights, in bytes. If the
+                       weights are larger they are computed on the fly
+        """
+        self.angles = np.asarray(angles, dtype=np.float64)
+        self.n_det = n_det
+        self.filter = ramp_filter(padded_size(n_det))
+        # Flat indexes of the pixels within the reconstruction circle
+        self.pixels = np.flatnonzero(~circle_mask(n_det))
+        self.i0 = None
+        self.w1 = None
+        self.folder = None
+        self.projector = None
+        n = len(self.angles) * len(self.pixels)
+        if n * 8 <= max_weights:
+            self.__build()
+
+    def __build(self):
+        n_angles, n_pixels = len(self.angles), len(self.pixels)
+        self.i0 = np.empty((n_angles, n_pixels), dtype=np.int32)
+        self.w1 = np.empty((n_angles, n_pixels), dtype=np.float32)
+        for i, angle in enumerate(self.angles):
+            self.i0[i], self.w1[i] = self.__pixel_weights(angle)
+
+    def __pixel_weights(self, angle):
+        i0, w1, valid = interp_weights(angle, self.n_det)
+        valid = valid.ravel()[self.pixels]
+        # The pixels not seen by the detector point to the padding
+        return (np.where(valid, i0.ravel()[self.pixels], self.n_det),
+                w1.ravel()[self.pixels])
+
+    def backproject_projection(self, i, filtered):
+        """Backprojects a single projection, without scaling it
+
+        Keyword arguments:
+        i -- The projection index
+        filtered -- (n_det, n_slices) filtered projection
+
+        Returns:
+        The (n_pixels, n_slices) contribution of the pixels within the
+        reconstruction circle
+        """
+        n_det, n_slices = filtered.shape
+        if self.i0 is None:
+            i0, w1 = self.__pixel_weights(self.angles[i])
+        else:
+            i0, w1 = self.i0[i], self.w1[i]
+        col = np.concatenate(
+            (filtered, np.zeros((2, n_slices), dtype=filtered.dtype)))
+        w1 = w1[:, np.newaxis]
+        return col[i0] * (1.0 - w1) + col[i0 + 1] * w1
+
+    def backproject_pixels(self, filtered, flat):
+        """Backprojects just some pixels of all the slices
+
+        Keyword arguments:
+        filtered -- (n_angles, n_det, n_slices) filtered sinogram
+        flat -- The flat indexes of the (n_det, n_det) pixels
+
+        Returns:
+        The (len(flat), n_slices) reconstructed pixels
+        """
+        n_angles, n_det, n_slices = filtered.shape
+        # The position of the pixels within the reconstruction circle
+        pos = np.minimum(np.searchsorted(self.pixels, flat),
+                         len(self.pixels) - 1)
+        inside = self.pixels[pos] == flat
+        pos = pos[inside]
+        padded = np.concatenate(
+            (filtered, np.zeros((n_angles, 2, n_slices),
+                                dtype=filtered.dtype)),
+            axis=1)
+        acc = np.zeros((len(pos), n_slices), dtype=np.float64)
+        for i in range(n_angles):
+            if self.i0 is None:
+                i0, w1 = self.__pixel_weights(self.angles[i])
+            else:
+                i0, w1 = self.i0[i], self.w1[i]
+            i0 = i0[pos]
+            w1 = w1[pos][:, np.newaxis]
+            col = padded[i]
+            acc += col[i0] * (1.0 - w1) + col[i0 + 1] * w1
+        out = np.zeros((len(flat), n_slices), dtype=np.float64)
+        out[inside] = acc * np.pi / (2 * n_angles)
+        return out
+
+    def filter_sinogram(self, sino):
+        """See filter_sinogram()"""
+        return filter_sinogram(sino, fourier_filter=self.filter)
+
+    def backproject(self, filtered):
+        """See backproject()"""
+        n_angles, n_det, n_slices = filtered.shape
+        if self.i0 is None:
+            return backproject(filtered, self.angles)
+        # Two trailing zeros, for the pixels not seen by the detector
+        padded = np.concatenate(
+            (filtered, np.zeros((n_angles, 2, n_slices),
+                                dtype=filtered.dtype)),
+            axis=1)
+        acc = np.zeros((len(self.pixels), n_slices), dtype=np.float64)
+        for i in range(n_angles):
+            col = padded[i]
+            i0 = self.i0[i]
+            w1 = self.w1[i][:, np.newaxis]
+            acc += col[i0] * (1.0 - w1) + col[i0 + 1] * w1
+        out = np.zeros((n_det * n_det, n_slices), dtype=np.float64)
+        out[self.pixels] = acc * np.pi / (2 * n_angles)
+        return out.reshape((n_det, n_det, n_slices))
+
+    def fbp(self, sino):
+        """See fbp()"""
+        return self.backproject(self.filter_sinogram(np.asarray(sino)))
+
+    def matrix(self):
+        """The sparse projection matrix, which transposed is the same
+        backprojection used by fbp(). It is built the first time it is
+        requested
+
+        Returns:
+        The (n_angles * n_det, n_pixels) scipy.sparse matrix
+        """
+        if self.projector is None:
+            self.projector = projection_matrix(self.angles, self.n_det,
+                                               self.pixels)
+        return self.projector
+
+    def save(self, folder):
+        """Saves the plan, so it can be loaded back with load()
+
+        Keyword arguments:
+        folder -- The folder where the plan files are written
+        """
+        os.makedirs(folder, exist_ok=True)
+        arrays = {'angles': self.angles,
+                  'filter': self.filter,
+                  'pixels': self.pixels}
+        if self.i0 is not None:
+            arrays.update({'i0': self.i0, 'w1': self.w1})
+        for name, arr in arrays.items():
+            fname = os.path.join(folder, name + '.npy')
+            with open(fname + '.tmp', 'wb') as f:
+                np.save(f, arr)
+            os.replace(fname + '.tmp', fname)
+        # The meta file is written the last, so partial plans are ignored
+        with open(os.path.join(folder, 'plan.json'), 'w') as f:
+            json.dump({'n_det': self.n_det}, f)
+        self.folder = folder
+
+
+class Streaming:
+    def __init__(self, plan, n_slices):
+        """Incremental filtered back-projection, where the projections are
+        added as soon as they are available. The volume is a valid, although
+        noisy, reconstruction at any moment
+
+        Keyword arguments:
+        plan -- The Plan of the whole scan
+        n_slices -- Number of slices
+        """
+        self.plan = plan
+        self.n_slices = n_slices
+        self.acc = np.zeros((len(plan.pixels), n_slices), dtype=np.float64)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def add(self, i, projection):
+        """Filters and backprojects a projection. It can be called from
+        several threads
+
+        Keyword arguments:
+        i -- The projection index
+        projection -- The (n_det, n_slices) projection
+        """
+        projection = np.asarray(projection)[np.newaxis]
+        filtered = self.plan.filter_sinogram(projection)[0]
+        contribution = self.plan.backproject_projection(i, filtered)
+        with self.lock:
+            self.acc += contribution
+            self.count += 1
+
+    def volume(self, out=None, block=BLOCK):
+        """The reconstruction with the projections added so far
+
+        Keyword arguments:
+        out -- The (n_det, n_det, n_slices) array where the volume is
+               written. None to allocate a new one
+        block -- Number of slices written at once. The lock is just held
+                 while each block is copied, so the projections keep being
+                 added meanwhile
+
+        Returns:
+        The volume
+        """
+        n_det = self.plan.n_det
+        if out is None:
+            out = np.zeros((n_det, n_det, self.n_slices), dtype=np.float64)
+        img = np.zeros((n_det * n_det, min(block, self.n_slices)),
+                       dtype=np.float64)
+        for z0 in range(0, self.n_slices, block):
+            z1 = min(z0 + block, self.n_slices)
+            with self.lock:
+                scale = np.pi / (2 * self.count) if self.count else 0.0
+                img[self.plan.pixels, :z1 - z0] = self.acc[:, z0:z1] * scale
+            out[:, :, z0:z1] = img[:, :z1 - z0].reshape(
+                (n_det, n_det, z1 - z0))
+        return out
+
+
+def projection_matrix(angles, n_det, pixels):
+    """Sparse parallel beam projection matrix, with the linear interpolation
+    weights of the backprojection
+
+    Keyword arguments:
+    angles -- The projection angles, in degrees
+    n_det -- Number of detector pixels
+    pixels -- The flat indexes of the reconstructed pixels
+
+    Returns:
+    The (n_angles * n_det, len(pixels)) scipy.sparse matrix
+    """
+    from scipy import sparse
+    rows, cols, data = [], [], []
+    for i, angle in enumerate(angles):
+        i0, w1, valid = interp_weights(angle, n_det)
+        i0 = i0.ravel()[pixels]
+        w1 = w1.ravel()[pixels]
+        valid = valid.ravel()[pixels]
+        for d, w in ((i0, 1.0 - w1), (i0 + 1, w1)):
+            j = np.flatnonzero(valid & (w > 0))
+            rows.append(i * n_det + d[j])
+            cols.append(j)
+            data.append(w[j])
+    return sparse.csr_matrix(
+        (np.concatenate(data).astype(np.float32),
+         (np.concatenate(rows), np.concatenate(cols))),
+        shape=(len(angles) * n_det, len(pixels)))
+
+
+def __gradient(img):
+    # Forward differences, with zero gradient across the last row/column
+    gx = np.diff(img, axis=0, append=img[-1:])
+    gy = np.diff(img, axis=1, append=img[:, -1:])
+    return gx, gy
+
+
+def __divergence(px, py):
+    # Minus the adjoint of __gradient()
+    return np.diff(px, axis=0, prepend=np.zeros_like(px[:1])) + \
+           np.diff(py, axis=1, prepend=np.zeros_like(py[:, :1]))
+
+
+def tv_denoise(img, weight, steps=TV_STEPS):
+    """Total variation denoising of each slice, with Chambolle's projection
+    algorithm. It solves min_u |u - img|^2 / 2 + lambda TV(u), so the
+    result is never further from img than the regularization requires,
+    whatever the number of steps is
+
+    Keyword arguments:
+    img -- The (n_det, n_det, n_slices) images
+    weight -- The regularization weight, relative to the images range, i.e.
+              lambda = weight * (max(img) - min(img))
+    steps -- Number of dual iterations
+
+    Returns:
+    The denoised images
+    """
+    lam = weight * float(np.ptp(img)) if img.size else 0.0
+    if lam <= 0:
+        return img
+    f = img / lam
+    px = np.zeros_like(img)
+    py = np.zeros_like(img)
+    for _ in range(steps):
+        gx, gy = __gradient(__divergence(px, py) - f)
+        norm = 1.0 + TV_TAU * np.sqrt(gx ** 2 + gy ** 2)
+        px = (px + TV_TAU * gx) / norm
+        py = (py + TV_TAU * gy) / norm
+    return img - lam * __divergence(px, py)
+
+
+def iterative(sino, plan, method='sirt', iterations=50, relaxation=1.0,
+              tol=1e-3, nonneg=True, tv=0.0, x0=None):
+    """Iterative reconstruction of a block of slices, which requires far
+    less projections than fbp() to get similar results
+
+    Keyword arguments:
+    sino -- (n_angles, n_det, n_slices) sinogram
+    plan -- The Plan of the sinogram angles and detector
+    method -- 'sirt' to update the images with all the projections at once,
+              or 'sart' to update them after each projection
+    iterations -- Maximum number of iterations
+    relaxation -- The update relaxation factor, between 0 and 2
+    tol -- Iterations stop when the relative residual improves less than
+           this between iterations
+    nonneg -- True to clip negative attenuations
+    tv -- Total variation regularization weight. The images are denoised
+          after each iteration, with a tv_denoise() weight proportional to
+          the relative change of that iteration, so the regularization
+          vanishes as the reconstruction converges. 0 to disable it
+    x0 -- The initial (n_det, n_det, n_slices) images. None to start from
+          the fbp() reconstruction
+
+    Returns:
+    The (n_det, n_det, n_slices) reconstruction
+    """
+    n_angles, n_det, n_slices = sino.shape
+    A = plan.matrix()
+    b = np.asarray(sino, dtype=np.float64).reshape((n_angles * n_det,
+                                                     n_slices))
+    if x0 is None:
+        x0 = plan.fbp(sino)
+    x = np.asarray(x0, dtype=np.float64).reshape(
+        (n_det * n_det, n_slices))[plan.pixels]
+    if nonneg:
+        np.maximum(x, 0.0, out=x)
+
+    # The subsets of rows updated at once
+    if method == 'sirt':
+        rows = [slice(None)]
+    elif method == 'sart':
+        # Consecutive projections are alike, so they are visited shuffled
+        order = np.random.RandomState(0).permutation(n_angles)
+        rows = [slice(i * n_det, (i + 1) * n_det) for i in order]
+    else:
+        raise ValueError('Unknown method "{}"'.format(method))
+    updates = []
+    for r in rows:
+        sub = A if method == 'sirt' else A[r]
+        row = np.asarray(sub.sum(axis=1)).ravel()
+        col = np.asarray(sub.sum(axis=0)).ravel()
+        updates.append((r, sub,
+                        np.where(row > 0, 1.0 / np.maximum(row, 1e-12), 0.0),
+                        np.where(col > 0, 1.0 / np.maximum(col, 1e-12), 0.0)))
+
+    norm_b = np.linalg.norm(b) or 1.0
+    residual = np.linalg.norm(b - A @ x) / norm_b
+    for _ in range(iterations):
+        last_x = x.copy() if tv > 0 else None
+        for r, sub, inv_row, inv_col in updates:
+            diff = (b[r] - sub @ x) * inv_row[:, np.newaxis]
+            x += relaxation * inv_col[:, np.newaxis] * (sub.T @ diff)
+            if nonneg:
+                np.maximum(x, 0.0, out=x)
+        if tv > 0:
+            change = np.linalg.norm(x - last_x) / (np.linalg.norm(x) or 1.0)
+            img = np.zeros((n_det * n_det, n_slices))
+            img[plan.pixels] = x
+            img = tv_denoise(img.reshape((n_det, n_det, n_slices)),
+                             tv * change)
+            x = img.reshape((n_det * n_det, n_slices))[plan.pixels]
+            if nonneg:
+                np.maximum(x, 0.0, out=x)
+        last, residual = residual, np.linalg.norm(b - A @ x) / norm_b
+        if last - residual < tol * last:
+            break
+
+    out = np.zeros((n_det * n_det, n_slices))
+    out[plan.pixels] = x
+    return out.reshape((n_det, n_det, n_slices))
+
+
+def reconstruct_block(sino, angles, plan=None, method='fbp', **kwargs):
+    """Reconstruction of a block of slices
+
+    Keyword arguments:
+    sino -- (n_angles, n_det, n_slices) sinogram
+    angles -- The projection angles, in degrees
+    plan -- The Plan to use, or the folder of a saved one. None to build it
+            if it is required
+    method -- The reconstruction method, one of METHODS
+    kwargs -- The iterative() options
+
+    Returns:
+    The (n_det, n_det, n_slices) reconstruction
+    """
+    if isinstance(plan, str):
+        if plan not in PLANS:
+            PLANS[plan] = load(plan)
+        plan = PLANS[plan]
+    if method == 'fbp':
+        return fbp(sino, angles) if plan is None else plan.fbp(sino)
+    if plan is None:
+        plan = Plan(angles, sino.shape[1])
+    return iterative(sino, plan, method=method, **kwargs)
+
+
+def load(folder):
+    """Loads a plan saved with Plan.save(). The weights are memory mapped,
+    so they are read from disk as they are required
+
+    Keyword arguments:
+    folder -- The folder where the plan files are written
+
+    Returns:
+    The plan, None if it cannot be loaded
+    """
+    try:
+        with open(os.path.join(folder, 'plan.json'), 'r') as f:
+            meta = json.load(f)
+        fname = os.path.join(folder, '{}.npy')
+        plan = Plan.__new__(Plan)
+        plan.n_det = meta['n_det']
+        plan.angles = np.load(fname.format('angles'))
+        plan.filter = np.load(fname.format('filter'))
+        plan.pixels = np.load(fname.format('pixels'))
+        plan.i0 = plan.w1 = plan.projector = None
+        if os.path.isfile(fname.format('i0')):
+            plan.i0 = np.load(fname.format('i0'), mmap_mode='r')
+            plan.w1 = np.load(fname.format('w1'), mmap_mode='r')
+    except (OSError, ValueError, KeyError):
+        return None
+    plan.folder = folder
+    return plan
+
+
+def __linear(idx, n):
+    # Linear interpolation lower indexes and upper weights. The points out
+    # of range point to the zero padding
+    valid = (idx >= 0) & (idx <= n - 1)
+    i0 = np.clip(np.floor(idx), 0, max(n - 2, 0)).astype(np.intp)
+    return np.where(valid, i0, n), np.where(valid, idx - i0, 0.0)
+
+
+def fdk(sino, angles, distance, width, height, block=BLOCK, workers=1):
+    """Feldkamp-Davis-Kress cone beam reconstruction, with the emitter and
+    the detector at half the distance from the rotation axis
+
+    Keyword arguments:
+    sino -- (n_angles, n_u, n_v) sinogram, with the detector rows sorted
+            from top to bottom
+    angles -- The projection angles, in degrees, spanning the whole turn
+    distance -- Distance between the emitter and the detector
+    width -- Horizontal size of the detector
+    height -- Vertical size of the detector
+    block -- Number of slices backprojected at once, bounding the memory
+    workers -- Number of blocks reconstructed at once, on threads
+
+    Returns:
+    A generator of the first and last slice of each reconstructed block,
+    and the (n_u, n_u, n_slices) block itself. The voxels are the detector
+    pixels scaled down to the rotation axis
+    """
+    n_angles, n_u, n_v = sino.shape
+    sod = 0.5 * distance
+    mag = distance / sod
+    du = width / n_u / mag
+    dv = height / n_v / mag
+    # The detector pixels, scaled down to the rotation axis
+    u = ((np.arange(n_u) + 0.5) / n_u - 0.5) * width / mag
+    v = (0.5 - (np.arange(n_v) + 0.5) / n_v) * height / mag
+    weight = sod / np.sqrt(sod ** 2 + u[:, np.newaxis] ** 2 +
+                           v[np.newaxis, :] ** 2)
+    fourier_filter = ramp_filter(padded_size(n_u))
+
+    radius = n_u // 2
+    xpr, ypr = (np.mgrid[:n_u, :n_u] - radius) * du
+    mask = circle_mask(n_u)
+
+    def backproject_block(z0, z1):
+        z = v[z0:z1]
+        out = np.zeros((n_u, n_u, z1 - z0), dtype=np.float64)
+        for i, angle in enumerate(np.deg2rad(angles)):
+            c, s = np.cos(angle), np.sin(angle)
+            ratio = sod / (sod + xpr * c + ypr * s)
+            j0, wu = __linear(ratio * (ypr * c - xpr * s) / du +
+                              0.5 * n_u - 0.5, n_u)
+            k0, wv = __linear(0.5 * n_v - 0.5 -
+                              ratio[..., np.newaxis] * z / dv, n_v)
+            valid = k0 < n_v
+            if not valid.any():
+                continue
+            # Cosine weighting and filtering of just the detector rows seen
+            # by the block, with two trailing zeros for the interpolation
+            # out of the detector. The rows are filtered independently
+            r0 = k0[valid].min()
+            r1 = min(k0[valid].max() + 2, n_v)
+            p = np.zeros((n_u + 2, r1 - r0 + 2), dtype=np.float32)
+            p[:n_u, :r1 - r0] = filter_sinogram(
+                np.asarray(sino[i:i + 1, :, r0:r1]) * weight[:, r0:r1],
+                fourier_filter=fourier_filter)[0]
+            k0 = np.where(valid, k0 - r0, r1 - r0)
+            j0 = j0[..., np.newaxis]
+            wu = wu[..., np.newaxis]
+            out += ratio[..., np.newaxis] ** 2 * (
+                (p[j0, k0] * (1.0 - wu) + p[j0 + 1, k0] * wu) * (1.0 - wv) +
+                (p[j0, k0 + 1] * (1.0 - wu) + p[j0 + 1, k0 + 1] * wu) * wv)
+        out[mask] = 0.0
+        # Same scaling as the parallel beam, but for the whole turn
+        return z0, z1, out * np.pi / (2 * n_angles)
+
+    blocks = [(z0, min(z0 + block, n_v)) for z0 in range(0, n_v, block)]
+    if workers <= 1:
+        for z0, z1 in blocks:
+            yield backproject_block(z0, z1)
+        return
+    # At most workers blocks are kept in memory, and they are yielded in
+    # order
+    pending = collections.deque()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as ex:
+        try:
+            for z0, z1 in blocks:
+                pending.append(ex.submit(backproject_block, z0, z1))
+                if len(pending) >= workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def __executor(workers, pool):
+    if pool == 'thread':
+        return concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    elif pool == 'process':
+        from ..xrayUtils.Processes import context
+        return concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                      mp_context=context())
+    raise ValueError('Unknown pool "{}"'.format(pool))
+
+
+def reconstruct(sino, angles, block=BLOCK, workers=1, pool='thread',
+                plan=None, method='fbp', **kwargs):
+    """Reconstruction of the whole sinogram, in blocks of slices
+
+    Keyword arguments:
+    sino -- (n_angles, n_det, n_slices) sinogram
+    angles -- The projection angles, in degrees
+    block -- Number of slices reconstructed at once
+    workers -- Number of blocks reconstructed in parallel
+    pool -- The kind of parallel pool, one of POOLS
+    plan -- The Plan to use. None to compute everything on the fly
+    method -- The reconstruction method, one of METHODS
+    kwargs -- The iterative() options
+
+    Returns:
+    A generator of the first and last slice of each reconstructed block,
+    and the (n_det, n_det, n_slices) block itself
+    """
+    n_slices = sino.shape[2]
+    blocks = [(z, min(z + block, n_slices))
+              for z in range(0, n_slices, block)]
+    if plan is None and method != 'fbp':
+        plan = Plan(angles, sino.shape[1])
+    if workers <= 1:
+        for z0, z1 in blocks:
+            yield z0, z1, reconstruct_block(sino[:, :, z0:z1], angles,
+                                            plan=plan, method=method,
+                                            **kwargs)
+        return
+
+    executor = __executor(workers, pool)
+    if plan is not None and pool == 'process':
+        # Sending the plan to the workers is expensive, so they load it
+        plan = plan.folder
+    elif plan is not None and method != 'fbp':
+        # Build the matrix before the threads share it
+        plan.matrix()
+    futures = {}
+    try:
+        for z0, z1 in blocks:
+            future = executor.submit(reconstruct_block,
+                                     np.asarray(sino[:, :, z0:z1]), angles,
+                                     plan=plan, method=method, **kwargs)
+            futures[future] = (z0, z1)
+        for future in concurrent.futures.as_completed(futures):
+            z0, z1 = futures[future]
+            yield z0, z1, future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+class LazyVolume:
+    def __init__(self, sino, plan, method='fbp', cache_size=64, prefetch=2,
+                 **kwargs):
+        """Volume whose slices are reconstructed the first time they are
+        read. It can be indexed as a (n_det, n_det, n_slices) array
+
+        Keyword arguments:
+        sino -- (n_angles, n_det, n_slices) sinogram
+        plan -- The Plan of the sinogram
+        method -- The reconstruction method, one of METHODS
+        cache_size -- Maximum number of reconstructed slices kept
+        prefetch -- Number of neighbour slices, at each side, reconstructed
+                    in background after a slice is read
+        kwargs -- The iterative() options
+        """
+        self.sino = sino
+        self.plan = plan
+        self.method = method
+        self.kwargs = kwargs
+        self.cache_size = cache_size
+        self.prefetch = prefetch
+        self.shape = (plan.n_det, plan.n_det, sino.shape[2])
+        self.ndim = 3
+        self.dtype = np.dtype(np.float32)
+        self.cache = collections.OrderedDict()
+        self.pending = {}
+        self.filtered = None
+        self.lock = threading.Lock()
+        if method != 'fbp':
+            # Build the matrix before the threads share it
+            plan.matrix()
+        self.closed = False
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        # The cuts across the slices are computed apart, so they are not
+        # delaying the prefetched slices
+        self.cuts = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def __reconstruct(self, z):
+        img = reconstruct_block(self.sino[:, :, z:z + 1], self.plan.angles,
+                                plan=self.plan, method=self.method,
+                                **self.kwargs)
+        img = np.asarray(img[:, :, 0], dtype=self.dtype)
+        with self.lock:
+            self.cache[z] = img
+            self.pending.pop(z, None)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return img
+
+    def get_slice(self, z):
+        """Get a slice, reconstructing it if it is not cached
+
+        Keyword arguments:
+        z -- The slice index
+
+        Returns:
+        The (n_det, n_det) slice
+        """
+        z = range(self.shape[2])[z]
+        with self.lock:
+            img = self.cache.get(z, None)
+            if img is not None:
+                self.cache.move_to_end(z)
+            future = self.pending.get(z, None)
+        if img is None:
+            img = future.result() if future else self.__reconstruct(z)
+        for dz in range(1, self.prefetch + 1):
+            for zz in (z - dz, z + dz):
+                if not 0 <= zz < self.shape[2]:
+                    continue
+                with self.lock:
+                    if zz in self.cache or zz in self.pending:
+                        continue
+                    self.pending[zz] = self.executor.submit(
+                        self.__reconstruct, zz)
+        return img
+
+    def __filtered(self):
+        if self.filtered is None:
+            self.filtered = np.asarray(
+                self.plan.filter_sinogram(np.asarray(self.sino)),
+                dtype=np.float32)
+        return self.filtered
+
+    def cut(self, x, y, z=None):
+        """Get pixels across several slices. With the filtered
+        back-projection just the requested pixels are reconstructed, while
+        the iterative methods reconstruct the whole slices
+
+        Keyword arguments:
+        x -- The first axis index or slice
+        y -- The second axis index or slice
+        z -- The slices. None for all of them
+
+        Returns:
+        The pixels, as indexing a (n_det, n_det, n_slices) array
+        """
+        zs = np.arange(self.shape[2])
+        if z is not None:
+            zs = zs[z]
+        if self.method != 'fbp':
+            return self.__iterative_cut(x, y, zs)
+        flat = np.arange(self.shape[0] * self.shape[1]).reshape(
+            self.shape[:2])[x, y]
+        flat = np.asarray(flat)
+        filtered = self.__filtered()[:, :, zs]
+        img = self.plan.backproject_pixels(filtered, flat.ravel())
+        return np.asarray(img, dtype=self.dtype).reshape(flat.shape +
+                                                         (len(zs),))
+
+    def __iterative_cut(self, x, y, zs, block=BLOCK):
+        # The slices are reconstructed in blocks, which are not cached, so
+        # the memory is bounded and the cached slices are not evicted
+        out = []
+        for k0 in range(0, len(zs), block):
+            if self.closed:
+                raise concurrent.futures.CancelledError()
+            chunk = zs[k0:k0 + block]
+            with self.lock:
+                cached = [self.cache.get(k, None) for k in chunk]
+            if all([img is not None for img in cached]):
+                out += [img[x, y] for img in cached]
+                continue
+            img = reconstruct_block(
+                np.asarray(self.sino[:, :, chunk]), self.plan.angles,
+                plan=self.plan, method=self.method, **self.kwargs)
+            out += [img[:, :, k][x, y] for k in range(len(chunk))]
+        return np.asarray(np.stack(out, axis=-1), dtype=self.dtype)
+
+    def submit_cut(self, x, y, z=None):
+        """Computes a cut() in background
+
+        Keyword arguments:
+        x -- The first axis index or slice
+        y -- The second axis index or slice
+        z -- The slices. None for all of them
+
+        Returns:
+        The concurrent.futures.Future of the cut
+        """
+        return self.cuts.submit(self.cut, x, y, z)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (3 - len(key))
+        x, y, z = key
+        if isinstance(z, (int, np.integer)):
+            return self.get_slice(z)[x, y]
+        return self.cut(x, y, z)
+
+    def __array__(self, dtype=None):
+        img = self.cut(slice(None), slice(None))
+        return img if dtype is None else img.astype(dtype)
+
+    def close(self):
+        """Cancels the pending slices reconstructions and cuts"""
+        self.closed = True
+        with self.lock:
+            for future in self.pending.values():
+                future.cancel()
+        self.executor.shutdown(wait=False)
+        self.cuts.shutdown(wait=False)
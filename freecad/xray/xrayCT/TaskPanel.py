@@ -20,7 +20,9 @@
 #*                                                                         *
 #***************************************************************************
 
+import os
 import time
+import concurrent.futures
 import numpy as np
 import FreeCAD as App
 import FreeCADGui as Gui
@@ -28,13 +30,18 @@ from FreeCAD import Units, ImageGui
 import Part
 from PySide import QtGui, QtCore
 from qtrangeslider import QRangeSlider
-from . import Tools, PlotAux
+from . import Tools, PlotAux, Reconstruction
 from .. import XRay_rc
-from ..xrayUtils import Selection, LightUnits
+from ..xrayRadiography import Tools as Radiography
+from ..xrayUtils import Selection, LightUnits, Checkpoint
 
 
 # The suggested power, as a function of the light area
 SPECIFIC_POWER = Units.parseQuantity('1000 W/m^2')
+# Below this number of angles the tomography is iteratively reconstructed
+SPARSE_VIEWS = 90
+# Time between the checks of the cuts computed in background, in ms
+CUT_INTERVAL = 100
 
 
 class TaskPanel:
@@ -46,15 +53,22 @@ class TaskPanel:
         self.ct = None
         self.running = False
         self.plot = None
+        # The cut of the lazy tomography being computed in background
+        self.cut = None
+        self.cut_timer = QtCore.QTimer()
+        self.cut_timer.setInterval(CUT_INTERVAL)
+        self.cut_timer.timeout.connect(self.onCut)
 
     def accept(self):
         if self.running:
             return False
+        self.close_tomography()
         return True
 
     def reject(self):
         if self.running:
             self.onStop()
+        self.close_tomography()
         return True
 
     def clicked(self, index):
@@ -83,6 +97,8 @@ class TaskPanel:
         self.form.max_error = self.widget(QtGui.QLineEdit, "max_error")
         self.form.power = self.widget(QtGui.QLineEdit, "power")
         self.form.use_gpu = self.widget(QtGui.QCheckBox, "use_gpu")
+        self.form.spectral_error = self.widget(QtGui.QLineEdit,
+                                               "spectral_error")
         self.form.run = self.widget(QtGui.QPushButton, "run")
         self.form.pbar = self.widget(QtGui.QProgressBar, "pbar")
         self.form.image_group = self.widget(QtGui.QGroupBox, "image_group")
@@ -147,6 +163,14 @@ class TaskPanel:
         self.form.power.setText(power.UserString)
         return False
 
+    def spectral_error(self):
+        # The adaptive spectral bins are only used on demand, since they
+        # approximate the result
+        try:
+            return max(float(self.form.spectral_error.text()), 0.0)
+        except ValueError:
+            return 0.0
+
     def onStart(self):
         if self.running:
             self.onStop()
@@ -156,15 +180,17 @@ class TaskPanel:
         self.form.pbar.setValue(0)
 
         n_angles = self.form.angles.value()
-        n_radon = self.xray.SensorResolutionY
+        n_radon = -(-self.xray.SensorResolutionY // Reconstruction.BLOCK)
         e = Units.parseQuantity(self.form.max_error.text())
         p = Units.parseQuantity(self.form.power.text())
+        bins = Radiography.select_bins(self.xray, self.spectral_error())
 
         self.form.image.clear()
+        self.close_tomography()
         # Get a first empty sinogram
         self.sino = np.zeros((n_angles,
                               self.xray.SensorResolutionX,
-                              self.xray.SensorResolutionY), dtype=np.float)
+                              self.xray.SensorResolutionY), dtype=np.float32)
         self.plot = PlotAux.Plot()
         # Plot the first image
         self.form.image.addItem(QtGui.QApplication.translate(
@@ -177,8 +203,14 @@ class TaskPanel:
         self.form.image.show()
 
         self.running = True
+        if self.xray.EmitterType != 'Cone' and n_angles >= SPARSE_VIEWS:
+            return self.stream(n_angles, e, p, bins)
+
+        rendered = set()
         sinograms = Tools.sinogram(
-            self.xray, n_angles, e, p, use_gpu=self.form.use_gpu.isChecked())
+            self.xray, n_angles, e, p, use_gpu=self.form.use_gpu.isChecked(),
+            order='golden', scan_dir=self.scan_dir(), bins=bins,
+            on_projection=lambda i, sino: rendered.add(i))
         for i, self.sino in enumerate(sinograms):
             self.update_plot()
             App.Console.PrintMessage("\t{} / {}\n".format(i + 1, n_angles))
@@ -186,13 +218,92 @@ class TaskPanel:
             if not self.running:
                 break
 
+        if self.running:
+            # The scan is finished, so it is not resumed anymore
+            Checkpoint.remove(self.scan_dir())
+        else:
+            # The projections are rendered in golden angle order, so the
+            # ones finished so far are evenly spread, and the tomography is
+            # reconstructed from them at a lower angular resolution
+            if len(rendered) < 2:
+                return False
+            App.Console.PrintMessage(
+                "\tReconstructing with {} / {} projections\n".format(
+                    len(rendered), n_angles))
+            self.running = True
+            self.form.run.setText(QtGui.QApplication.translate(
+                "XRay", "Stop", None))
+
+        self.add_tomography()
+
+        method = 'sirt' if n_angles < SPARSE_VIEWS else 'fbp'
+        if self.xray.EmitterType != 'Cone':
+            # The slices are reconstructed as they are shown
+            self.ct = Tools.lazy_tomography(self.xray, self.sino,
+                                            method=method, indexes=rendered)
+            self.update_plot()
+            return True
+
+        tomographies = Tools.tomography(
+            self.xray, self.sino, workers=os.cpu_count() or 1, method=method,
+            indexes=rendered)
+        for i, self.ct in enumerate(tomographies):
+            self.update_plot()
+            App.Console.PrintMessage("\t{} / {}\n".format(i + 1, n_radon))
+            self.form.pbar.setValue(100 * (i + 1) / n_radon)
+            if not self.running:
+                break
+
         if not self.running:
             return False
 
+        return True
+
+    def scan_dir(self):
+        # Folder where the finished projections are saved, so the scan is
+        # resumed if it is interrupted. It is removed when the scan finishes
+        return os.path.join(App.getUserAppDataDir(), 'XRay', 'scans',
+                            '{}.{}'.format(self.xray.Document.Name,
+                                           self.xray.Name))
+
+    def close_tomography(self):
+        # Stop the background reconstructions of the lazy tomography
+        self.cut_timer.stop()
+        self.cut = None
+        if isinstance(self.ct, Reconstruction.LazyVolume):
+            self.ct.close()
+
+    def lazy_cut(self, axis, index):
+        # The cuts across the slices of a lazy tomography require
+        # reconstructing all of them, so they are computed in background.
+        # None is returned until the cut is ready
+        key = (id(self.ct), axis, index)
+        if self.cut is not None and self.cut[0] == key:
+            future = self.cut[1]
+            if not future.done() or future.cancelled():
+                return None
+            try:
+                return future.result()
+            except concurrent.futures.CancelledError:
+                return None
+        if self.cut is not None:
+            self.cut[1].cancel()
+        x = index if axis == 0 else slice(None)
+        y = index if axis == 1 else slice(None)
+        self.cut = (key, self.ct.submit_cut(x, y))
+        self.cut_timer.start()
+        return None
+
+    def onCut(self):
+        if self.cut is None or self.cut[1].done():
+            self.cut_timer.stop()
+            self.update_plot()
+
+    def add_tomography(self):
         # Get a first empty tomography and plot it
         self.ct = np.zeros((self.xray.SensorResolutionX,
                             self.xray.SensorResolutionX,
-                            self.xray.SensorResolutionY), dtype=np.float)
+                            self.xray.SensorResolutionY), dtype=np.float32)
         self.form.image.addItem(QtGui.QApplication.translate(
             "XRay", "Tomography (X slices)", None))
         self.form.image.addItem(QtGui.QApplication.translate(
@@ -201,17 +312,33 @@ class TaskPanel:
             "XRay", "Tomography (Z slices)", None))
         self.form.image.setCurrentIndex(5)
 
-        for i, self.ct in enumerate(Tools.tomography(self.xray, self.sino)):
+    def stream(self, n_angles, e, p, bins):
+        # A quick preview is computed first, and then the tomography is
+        # reconstructed while the full sinogram is rendered
+        self.add_tomography()
+        scans = Tools.preview_tomography(
+            self.xray, n_angles, e, p, use_gpu=self.form.use_gpu.isChecked(),
+            order='golden', scan_dir=self.scan_dir(), bins=bins)
+        stage = shape = None
+        for new_stage, self.sino, ct in scans:
+            if ct is not None:
+                self.ct = ct
+            if new_stage != stage:
+                stage, i = new_stage, 0
+            if (self.sino.shape, self.ct.shape) != shape:
+                # The resolution changes between stages
+                shape = (self.sino.shape, self.ct.shape)
+                self.onImage(self.form.image.currentIndex())
+            i = min(i + 1, self.sino.shape[0])
             self.update_plot()
-            App.Console.PrintMessage("\t{} / {}\n".format(i + 1, n_radon))
-            self.form.pbar.setValue(100 * (i + 1) / n_radon)
+            App.Console.PrintMessage("\t{}: {} / {}\n".format(
+                stage, i, self.sino.shape[0]))
+            self.form.pbar.setValue(100 * i / self.sino.shape[0])
             if not self.running:
                 break
-
-        if not self.running:
-            return False
-
-        return True
+        if self.running:
+            Checkpoint.remove(self.scan_dir())
+        return self.running
 
     def onStop(self):
         if not self.running:
@@ -260,13 +387,22 @@ class TaskPanel:
             if i != 2:
                 aspect = 'auto'
         cmap = self.form.cmap.currentIndex()
+        if isinstance(img, Reconstruction.LazyVolume) and i != 2:
+            img = self.lazy_cut(i, self.form.slice.value())
+            if img is None:
+                # The plot is updated when the cut is ready
+                return
+        else:
+            slicer = [np.s_[:], np.s_[:], np.s_[:]]
+            slicer[i] = self.form.slice.value()
+            slicer = tuple(slicer)
+            # Just the shown slice is read, since the whole sinogram or
+            # tomography might be stored on disk
+            img = img[slicer]
+        img = np.transpose(img)
         vmin, vmax = self.form.crange.value()
         vmin = vmin / 1000 * np.max(img)
         vmax = vmax / 1000 * np.max(img)
-        slicer = [np.s_[:], np.s_[:], np.s_[:]]
-        slicer[i] = self.form.slice.value()
-        slicer = tuple(slicer)
-        img = np.transpose(img[slicer])
         self.plot.update(
             img, cmap_index=cmap, vmin=vmin, vmax=vmax, aspect=aspect)
 
@@ -21,27 +21,210 @@
 #***************************************************************************
 
 
+import os
 import time
+import shutil
+import tempfile
+import concurrent.futures
 import numpy as np
-from skimage.transform import radon, iradon
 import FreeCAD as App
 from FreeCAD import Units, Vector, Mesh
 from PySide import QtGui, QtCore
 import Part
-from ..xrayUtils import LuxCore, LightUnits
+from ..xrayUtils import LuxCore, LightUnits, Storage, PlanCache, Monitor
+from ..xrayUtils import BackgroundCache, PlyCache, Checkpoint, Processes
 from ..xrayRadiography import Tools as Radiography
+from . import Workers, Reconstruction
 
 
 RUNNING = None
+# Storage order of the sinograms and tomographies axes, so the slices
+# are contiguous in memory (or on disk). Thus the .npy files are
+# (angles, rows, columns) and (Z, X, Y) arrays
+SINO_AXES = (0, 2, 1)
+VOLUME_AXES = (2, 0, 1)
+# The last reconstruction plan, by its PlanCache digest
+PLANS = {}
+# The orders the projections can be rendered in, see
+# Reconstruction.acquisition_order()
+ORDERS = Reconstruction.ORDERS
+# Seconds between the streamed tomography updates
+STREAMING_INTERVAL = 1.0
 
 
-def __angles(n):
-    angles = np.linspace(0, 180.0, num=n, endpoint=False)
+def __angles(xray, n):
+    # The cone beams require the whole turn to be reconstructed
+    span = 360.0 if xray.EmitterType == 'Cone' else 180.0
+    angles = np.linspace(0, span, num=n, endpoint=False)
     angles += 0.5 * (angles[1] - angles[0])
     return angles
 
 
-def sinogram(xray, n, e, power, use_gpu=False):
+def __rendered(xray, sino, indexes):
+    # The angles and projections actually rendered. A stopped scan is
+    # reconstructed with them, at a lower angular resolution, instead of
+    # backprojecting zeros for the missing ones
+    angles = __angles(xray, sino.shape[0])
+    if indexes is None or len(indexes) == sino.shape[0]:
+        return angles, sino
+    indexes = np.sort(np.asarray(list(indexes), dtype=np.intp))
+    if not len(indexes):
+        raise ValueError('No projections were rendered')
+    return angles[indexes], np.asarray(sino)[indexes]
+
+
+def __plan(xray, angles, n_det):
+    # Get the reconstruction plan, from memory, from disk or building it
+    key = PlanCache.digest(angles, n_det, xray.EmitterType)
+    if key in PLANS:
+        return PLANS[key]
+    folder = PlanCache.load(key)
+    plan = None if folder is None else Reconstruction.load(folder)
+    if plan is None:
+        plan = Reconstruction.Plan(angles, n_det)
+        PlanCache.store(key, plan)
+    PLANS.clear()
+    PLANS[key] = plan
+    return plan
+
+
+def __scan_params(xray, n, e, power, use_gpu, engine, bins, profile,
+                  resolution):
+    # The parameters the projections depend on, so the checkpoints of a
+    # different scan are not mixed. The render options are the same ones
+    # of the background cache key, since the GPU usage, for instance,
+    # changes the laser threshold and the render settings. The threads
+    # and the rendering order have no effect on the projections
+    bins = bins or Radiography.spectral_bins(xray)
+    return {
+        'machine': BackgroundCache.digest(xray, power, e,
+                                          resolution=resolution,
+                                          engine=engine, use_gpu=use_gpu,
+                                          profile=profile),
+        'objects': [PlyCache.digest(obj.Source) for obj in xray.ScanObjects],
+        'mu': [[float(mu) for mu in obj.Proxy.average_mu(obj, bins)]
+               for obj in xray.ScanObjects],
+        'bins': [list(b) for b in bins],
+        'n': n,
+    }
+
+
+def __process_events(timer, loop):
+    # Make FreeCAD responsive. There is no event loop without GUI, e.g. on
+    # FreeCADCmd
+    if QtCore.QCoreApplication.instance() is None:
+        return
+    timer.start(0.0)
+    loop.exec_()
+
+
+def __wait(session):
+    # Wait for the session to finish, keeping FreeCAD responsive. False is
+    # returned if the user stopped the process
+    last = {'conv': None}
+
+    def progress(step, conv):
+        if int(1000 * conv) != last['conv']:
+            last['conv'] = int(1000 * conv)
+            App.Console.PrintMessage("\t\t{} {:.1f}%\n".format(
+                step, 100 * conv))
+
+    return Monitor.wait(session, on_progress=progress,
+                        running=lambda: RUNNING)
+
+
+def __parallel_sinogram(xray, angles, sino, e, power, use_gpu, engine,
+                        processes, threads, bins, profile, resolution,
+                        timer, loop, on_projection, order, checkpoint):
+    # The workers are loading a copy of the document, so the unsaved changes
+    # are considered as well
+    folder = tempfile.mkdtemp()
+    doc_path = os.path.join(folder, 'sinogram.FCStd')
+    xray.Document.saveCopy(doc_path)
+    # The cores are split among the workers, as LuxCore would take them all
+    threads = threads or max(1, (os.cpu_count() or 1) // processes)
+    bkg = None if checkpoint is None else checkpoint.load_background()
+
+    def store(future):
+        # Write a finished projection, returning False if the worker was
+        # stopped before finishing it
+        i, img, new_bkg = future.result()
+        if checkpoint is not None and new_bkg is not None and \
+                not checkpoint.background:
+            checkpoint.store_background(new_bkg)
+        if img is None:
+            return False
+        sino[i, :, :] = img
+        if checkpoint is not None:
+            checkpoint.store(i, img)
+        if on_projection is not None:
+            on_projection(i, sino)
+        return True
+
+    ctx = Processes.context()
+    manager = ctx.Manager()
+    queue = manager.Queue()
+    stop = manager.Event()
+    pool = concurrent.futures.ProcessPoolExecutor(
+        max_workers=processes, mp_context=ctx, initializer=Workers.init,
+        initargs=(doc_path, xray.Name, e.Value, power.getValueAs('W').Value,
+                  use_gpu, engine, threads, bins, profile, resolution, bkg,
+                  queue, stop))
+    indexes = Reconstruction.acquisition_order(len(angles), order)
+    if checkpoint is not None:
+        indexes = checkpoint.pending(indexes)
+    pending = set()
+    try:
+        for i in indexes:
+            pending.add(pool.submit(Workers.projection, i, angles[i]))
+        progress = {}
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, timeout=0.1,
+                return_when=concurrent.futures.FIRST_COMPLETED)
+            # The finished projections are kept even if the scan is stopped
+            stored = [store(future) for future in done]
+            while not queue.empty():
+                pid, i, conv = queue.get_nowait()
+                if progress.get(pid, None) != (i, int(100 * conv)):
+                    progress[pid] = (i, int(100 * conv))
+                    App.Console.PrintMessage(
+                        "\t\tworker {}, angle {}: {:.1f}%\n".format(
+                            pid, i, 100 * conv))
+            for ok in stored:
+                if ok:
+                    yield sino
+            __process_events(timer, loop)
+            if not RUNNING:
+                return
+    finally:
+        stop.set()
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
+        # The projections finished while the workers were stopping
+        for future in pending:
+            if not future.cancelled() and future.exception() is None:
+                store(future)
+        manager.shutdown()
+        shutil.rmtree(folder, ignore_errors=True)
+        Storage.flush(sino)
+
+
+def __rotated(xray, sessions, folder, angle, angle0):
+    # Rotating a kept session restarts it, so each one is rotated just when
+    # it is going to be rendered, instead of all of them competing for the
+    # cores
+    for session in sessions:
+        Radiography.rotate(xray, session, angle, angle0)
+        yield folder, session
+
+
+def sinogram(xray, n, e, power, use_gpu=False, engine='luxcore',
+             reuse_sessions=False, processes=1, threads=0, bins=None,
+             dtype=np.float32, storage=None, on_projection=None,
+             order='linear', scan_dir=None, profile='full',
+             resolution=None):
     global RUNNING
     RUNNING = True
 
@@ -55,49 +238,93 @@ def sinogram(xray, n, e, power, use_gpu=False):
                            QtCore.SLOT("quit()"))
 
     # Setup the sinogram image
-    angles = __angles(n)
-    sino = np.zeros((n, xray.SensorResolutionX, xray.SensorResolutionY),
-                    dtype=np.float)
+    angles = __angles(xray, n)
+    resolution = Radiography.sensor_resolution(xray, resolution)
+    sino = Storage.allocate((n,) + resolution, dtype=dtype, folder=storage,
+                            name='sinogram', axes=SINO_AXES)
+
+    # The projections finished by an interrupted scan are loaded back
+    checkpoint = None
+    if scan_dir is not None:
+        checkpoint = Checkpoint.Checkpoint(
+            scan_dir, __scan_params(xray, n, e, power, use_gpu, engine,
+                                    bins, profile, resolution))
+        for i in sorted(checkpoint.done):
+            sino[i, :, :] = checkpoint.load(i)
+            if on_projection is not None:
+                on_projection(i, sino)
+            yield sino
+
+    if processes > 1:
+        yield from __parallel_sinogram(xray, angles, sino, e, power, use_gpu,
+                                       engine, processes, threads, bins,
+                                       profile, resolution, timer, loop,
+                                       on_projection, order, checkpoint)
+        return
 
+    # The LuxCore sessions of the first angle might be kept alive, rotating
+    # the machine on their scenes afterwards
+    reuse_sessions = reuse_sessions and engine == 'luxcore'
+    kept = []
     folder = None
-    bkg = None
-    for i, angle in enumerate(angles):
-        a = angle * Units.Degree
-        samples = []
-        if bkg is not None:
-            samples.append(bkg)
-        sessions = Radiography.radiography(
-            xray, a, e, power,
-            tmppath=folder, background=bkg is None, use_gpu=use_gpu)
-        for folder, session in sessions:
-            while not session.HasDone():
-                if not RUNNING:
+    bkg = None if checkpoint is None else checkpoint.load_background()
+    indexes = Reconstruction.acquisition_order(n, order)
+    if checkpoint is not None:
+        indexes = checkpoint.pending(indexes)
+    try:
+        # The sinogram is kept sorted, whatever the rendering order is
+        first = None
+        for i in indexes:
+            if first is None:
+                first = i
+            a = angles[i] * Units.Degree
+            samples = []
+            if bkg is not None:
+                samples.append(bkg)
+            if kept:
+                sessions = __rotated(xray, kept, folder, a,
+                                     angles[first] * Units.Degree)
+            else:
+                sessions = Radiography.radiography(
+                    xray, a, e, power,
+                    tmppath=folder, background=bkg is None, use_gpu=use_gpu,
+                    engine=engine, threads=threads, bins=bins,
+                    profile=profile, resolution=resolution)
+            for folder, session in sessions:
+                if not __wait(session):
                     session.Stop()
-                    raise StopIteration
-                session.UpdateStats()
-                stats = session.GetStats()
-                step = stats.Get("stats.renderengine.pass").GetInt()
-                conv = stats.Get("stats.renderengine.convergence").GetFloat()
-                App.Console.PrintMessage("\t\t{} {:.1f}%\n".format(
-                    step, 100 * conv))
-                timer.start(0.0)
-                loop.exec_()
-                time.sleep(1.0)
-            session.Stop()
-            imgs = Radiography.get_imgs(folder, session)
-            if bkg is None:
-                # Keep just one background image channel
-                bkg = imgs[0]
-                imgs = [bkg]
-            samples = samples + imgs
+                    return
+                imgs = Radiography.get_imgs(folder, session)
+                if bkg is None:
+                    # Keep just one background image channel
+                    session.Stop()
+                    bkg = imgs[0]
+                    imgs = [bkg]
+                    if checkpoint is not None:
+                        checkpoint.store_background(bkg)
+                elif reuse_sessions and i == first:
+                    kept.append(session)
+                else:
+                    session.Stop()
+                samples = samples + imgs
 
-        # Assemble the final radiography
-        img = Radiography.assemble_radiography(xray, samples)
-        sino[i, :, :] = np.transpose(img[:, :])
-        yield sino
+            # Assemble the final radiography
+            img = Radiography.assemble_radiography(xray, samples, bins=bins)
+            sino[i, :, :] = np.transpose(img[:, :])
+            if checkpoint is not None:
+                checkpoint.store(i, sino[i, :, :])
+            if on_projection is not None:
+                on_projection(i, sino)
+            yield sino
+    finally:
+        for session in kept:
+            session.Stop()
+        Storage.flush(sino)
 
 
-def tomography(xray, sino):
+def tomography(xray, sino, dtype=np.float32, storage=None,
+               block=Reconstruction.BLOCK, workers=1, pool='thread',
+               method='fbp', indexes=None, **kwargs):
     global RUNNING
     RUNNING = True
 
@@ -110,20 +337,126 @@ def tomography(xray, sino):
                            loop,
                            QtCore.SLOT("quit()"))
 
-    # Setup the sinogram image
-    angles = __angles(sino.shape[0])
-    w = xray.SensorResolutionX
-    h = xray.SensorResolutionY
-    dcm = np.zeros((w, w, h), dtype=np.float)
+    # Setup the sinogram image. It might have a different resolution than
+    # the machine, e.g. on previews
+    angles, sino = __rendered(xray, sino, indexes)
+    _, w, h = sino.shape
+    dcm = Storage.allocate((w, w, h), dtype=dtype, folder=storage,
+                           name='tomography', axes=VOLUME_AXES)
+
+    # The slices are reconstructed in blocks, yielding after each one
+    if xray.EmitterType == 'Cone':
+        distance = xray.ChamberDistance.getValueAs(Radiography.SCALE).Value
+        width, height = Radiography.detector_size(xray)
+        # FDK blocks are always reconstructed on threads
+        blocks = Reconstruction.fdk(sino, angles, distance, width, height,
+                                    block=block, workers=workers)
+    else:
+        blocks = Reconstruction.reconstruct(sino, angles, block=block,
+                                            workers=workers, pool=pool,
+                                            plan=__plan(xray, angles, w),
+                                            method=method, **kwargs)
+    try:
+        for z0, z1, img in blocks:
+            if not RUNNING:
+                return
+            dcm[:, :, z0:z1] = img
+            __process_events(timer, loop)
+            yield dcm
+    finally:
+        blocks.close()
+        Storage.flush(dcm)
 
-    for z in range(h):
+
+def lazy_tomography(xray, sino, method='fbp', indexes=None, **kwargs):
+    # The slices are reconstructed as they are read
+    if xray.EmitterType == 'Cone':
+        raise ValueError('Cone beam tomographies cannot be lazily computed')
+    angles, sino = __rendered(xray, sino, indexes)
+    return Reconstruction.LazyVolume(sino,
+                                     __plan(xray, angles, sino.shape[1]),
+                                     method=method, **kwargs)
+
+
+def streaming_tomography(xray, n, e, power, dtype=np.float32, storage=None,
+                         interval=STREAMING_INTERVAL, **kwargs):
+    # The projections are backprojected on a separate thread as soon as
+    # they are rendered, so the tomography is available during the whole
+    # scan. Only the parallel back-projection can be computed this way.
+    # Every projection contributes to the whole volume, so it is rewritten
+    # at most once each interval seconds, and the yielded one might be
+    # slightly behind the sinogram
+    if xray.EmitterType == 'Cone':
+        raise ValueError('Cone beam tomographies cannot be streamed')
+    angles = __angles(xray, n)
+    w, h = Radiography.sensor_resolution(xray, kwargs.get('resolution'))
+    stream = Reconstruction.Streaming(__plan(xray, angles, w), h)
+    dcm = Storage.allocate((w, w, h), dtype=dtype, folder=storage,
+                           name='tomography', axes=VOLUME_AXES)
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    futures = []
+
+    def add(i, sino):
+        futures.append(executor.submit(stream.add, i, np.array(sino[i])))
+
+    sinograms = sinogram(xray, n, e, power, dtype=dtype, storage=storage,
+                         on_projection=add, **kwargs)
+    last = None
+    try:
+        for sino in sinograms:
+            if last is None or time.monotonic() - last >= interval:
+                stream.volume(out=dcm)
+                last = time.monotonic()
+            yield sino, dcm
         if not RUNNING:
-            raise StopIteration
-        img = iradon(np.transpose(sino[:, :, z]), theta=angles, circle=True)
-        dcm[:, :, z] = img
-        timer.start(0.0)
-        loop.exec_()
-        yield dcm
+            return
+        # Wait for the last projections
+        for future in futures:
+            future.result()
+        stream.volume(out=dcm)
+        yield sino, dcm
+    finally:
+        sinograms.close()
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+        Storage.flush(dcm)
+
+
+def preview_tomography(xray, n, e, power, factor=4, dtype=np.float32,
+                       storage=None, scan_dir=None, **kwargs):
+    # A quick scan, with a lower resolution, less angles and a looser error,
+    # is carried out first. The full scan is rendered afterwards, reusing
+    # the cached meshes, backgrounds and plans. The stage, the sinogram and
+    # the tomography (None while it is not available) are yielded
+    res_x, res_y = Radiography.sensor_resolution(xray)
+    resolution = (max(res_x // factor, 1), max(res_y // factor, 1))
+    sino = ct = None
+    for sino in sinogram(xray, min(n, max(n // factor, 8)), e * factor,
+                         power, dtype=dtype, resolution=resolution,
+                         **kwargs):
+        yield 'preview', sino, None
+    if not RUNNING:
+        return
+    for ct in tomography(xray, sino, dtype=dtype):
+        pass
+    if not RUNNING:
+        return
+    yield 'preview', sino, ct
+
+    if xray.EmitterType != 'Cone':
+        for sino, ct in streaming_tomography(xray, n, e, power, dtype=dtype,
+                                             storage=storage,
+                                             scan_dir=scan_dir, **kwargs):
+            yield 'refine', sino, ct
+        return
+    for sino in sinogram(xray, n, e, power, dtype=dtype, storage=storage,
+                         scan_dir=scan_dir, **kwargs):
+        yield 'refine', sino, None
+    if not RUNNING:
+        return
+    for ct in tomography(xray, sino, dtype=dtype, storage=storage):
+        yield 'refine', sino, ct
 
 
 def stop():
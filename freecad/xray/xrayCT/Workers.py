@@ -0,0 +1,124 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+# Projections rendered on worker processes. This module is imported by the
+# workers, so it must not depend on the GUI
+
+
+import os
+import time
+import tempfile
+import numpy as np
+
+
+# Seconds between the progress reports of the workers
+POLL_INTERVAL = 0.25
+# The worker process state, set by init()
+STATE = {}
+
+
+def init(doc_path, xray_name, e, power, use_gpu, engine, threads, bins,
+         profile, resolution, bkg, queue, stop):
+    """Worker initializer, loading the document and creating the worker
+    own temporal folder
+
+    Keyword arguments:
+    doc_path -- The FreeCAD document file
+    xray_name -- The name of the X-Ray machine object in the document
+    e -- Maximum admissible error
+    power -- Emitter power, in W
+    use_gpu -- True if the GPU shall be used
+    engine -- One of xrayRadiography.Tools.ENGINES
+    threads -- Number of LuxCore threads of this worker, 0 for all
+    bins -- The spectral bins, None for the uniform ones
+    profile -- One of xrayRadiography.Tools.PROFILES
+    resolution -- The (x, y) sensor resolution, None for the machine one
+    bkg -- The background image, None to render it with the first projection
+    queue -- Queue where the progress is reported
+    stop -- Event to cancel the rendering
+    """
+    import FreeCAD as App
+    doc = App.openDocument(doc_path)
+    STATE.update({
+        'xray': doc.getObject(xray_name),
+        'e': App.Units.Quantity(e),
+        'power': App.Units.parseQuantity('{} W'.format(power)),
+        'use_gpu': use_gpu,
+        'engine': engine,
+        'threads': threads,
+        'bins': bins,
+        'profile': profile,
+        'resolution': resolution,
+        'queue': queue,
+        'stop': stop,
+        'folder': tempfile.mkdtemp(),
+        'bkg': bkg,
+    })
+
+
+def projection(i, angle):
+    """Renders a projection on the worker
+
+    Keyword arguments:
+    i -- The projection index
+    angle -- The angle, in degrees
+
+    Returns:
+    The projection index, the (x, y) resolution projection, which is None
+    if the process was stopped, and the background image if it was
+    rendered with this projection, None otherwise
+    """
+    from FreeCAD import Units
+    from ..xrayRadiography import Tools as Radiography
+
+    xray = STATE['xray']
+    bkg = None
+    samples = []
+    if STATE['bkg'] is not None:
+        samples.append(STATE['bkg'])
+    sessions = Radiography.radiography(
+        xray, angle * Units.Degree, STATE['e'], STATE['power'],
+        tmppath=STATE['folder'], background=STATE['bkg'] is None,
+        use_gpu=STATE['use_gpu'], engine=STATE['engine'],
+        threads=STATE['threads'], bins=STATE['bins'],
+        profile=STATE['profile'], resolution=STATE['resolution'])
+    for folder, session in sessions:
+        while not session.HasDone():
+            if STATE['stop'].is_set():
+                session.Stop()
+                return i, None, bkg
+            session.UpdateStats()
+            stats = session.GetStats()
+            conv = stats.Get("stats.renderengine.convergence").GetFloat()
+            STATE['queue'].put((os.getpid(), i, conv))
+            time.sleep(POLL_INTERVAL)
+        imgs = Radiography.get_imgs(folder, session)
+        session.Stop()
+        if STATE['bkg'] is None:
+            # Keep just one background image channel
+            STATE['bkg'] = bkg = imgs[0]
+            imgs = [bkg]
+        samples = samples + imgs
+    STATE['queue'].put((os.getpid(), i, 1.0))
+
+    img = Radiography.assemble_radiography(xray, samples, bins=STATE['bins'])
+    return i, np.ascontiguousarray(np.transpose(img), dtype=np.float32), bkg
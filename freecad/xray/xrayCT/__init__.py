@@ -20,8 +20,7 @@
 #*                                                                         *
 #***************************************************************************
 
-from .TaskPanel import createTask
-
-
 def load():
+    # The GUI is imported on demand, so the tools can be used without it
+    from .TaskPanel import createTask
     createTask()
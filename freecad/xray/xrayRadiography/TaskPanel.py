@@ -21,6 +21,7 @@
 #***************************************************************************
 
 import time
+import numpy as np
 import FreeCAD as App
 import FreeCADGui as Gui
 from FreeCAD import Units, ImageGui
@@ -29,11 +30,13 @@ from PySide import QtGui, QtCore
 from qtrangeslider import QRangeSlider
 from . import Tools, PlotAux
 from .. import XRay_rc
-from ..xrayUtils import Selection, LightUnits
+from ..xrayUtils import Selection, LightUnits, Monitor
 
 
 # The suggested power, as a function of the light area
 SPECIFIC_POWER = Units.parseQuantity('1000 W/m^2')
+# Minimum time between the radiography previews, in seconds
+PREVIEW_INTERVAL = 1.0
 
 
 class TaskPanel:
@@ -100,6 +103,8 @@ class TaskPanel:
         self.form.max_error = self.widget(QtGui.QLineEdit, "max_error")
         self.form.power = self.widget(QtGui.QLineEdit, "power")
         self.form.use_gpu = self.widget(QtGui.QCheckBox, "use_gpu")
+        self.form.spectral_error = self.widget(QtGui.QLineEdit,
+                                               "spectral_error")
         self.form.run = self.widget(QtGui.QPushButton, "run")
         self.form.pbar = self.widget(QtGui.QProgressBar, "pbar")
         self.form.image = self.widget(QtGui.QComboBox, "image")
@@ -159,6 +164,14 @@ class TaskPanel:
         self.form.power.setText(power.UserString)
         return False
 
+    def spectral_error(self):
+        # The adaptive spectral bins are only used on demand, since they
+        # approximate the result
+        try:
+            return max(float(self.form.spectral_error.text()), 0.0)
+        except ValueError:
+            return 0.0
+
     def onStart(self):
         if self.luxcore:
             self.onStop()
@@ -168,90 +181,57 @@ class TaskPanel:
         self.form.pbar.setValue(0)
 
         # Get the number of images/LuxCore sessions, and give them titles
-        n = self.xray.EmitterSamples
-        if n % 3:
-            n = 3 * (n // 3 + 1)
+        bins = Tools.select_bins(self.xray, self.spectral_error())
         self.titles = ["Background"]
-        e0 = LightUnits.to_energy(self.xray.EmitterMinFreq)
-        e1 = LightUnits.to_energy(self.xray.EmitterMaxFreq)
-        de = (e1 - e0) / (n + 1)
-        for i in range(n):
-            e = e0 + (i + 0.5) * de
+        for e_min, e_max, _ in bins:
+            e = Units.parseQuantity('{} keV'.format(0.5 * (e_min + e_max)))
             self.titles.append(e.UserString)
-        n //= 3
+        n = len(bins) // 3
         n += 1  # The background image
+        self.n_sessions = n
 
-        # Make FreeCAD responsive
-        self.loop = QtCore.QEventLoop()
-        self.timer = QtCore.QTimer()
-        self.timer.setSingleShot(True)
-        QtCore.QObject.connect(self.timer,
-                               QtCore.SIGNAL("timeout()"),
-                               self.loop,
-                               QtCore.SLOT("quit()"))
         a = Units.parseQuantity(self.form.angle.text())
         e = Units.parseQuantity(self.form.max_error.text())
         p = Units.parseQuantity(self.form.power.text())
         self.images = []
         self.form.image.clear()
         self.plot = PlotAux.Plot(self.xray)
-        current_image = -1
+        # The previews are read on the same buffer again and again
+        self.preview = np.empty((self.xray.SensorResolutionY,
+                                 self.xray.SensorResolutionX,
+                                 3), dtype=np.float32)
         sessions = Tools.radiography(
-            self.xray, a, e, p, use_gpu=self.form.use_gpu.isChecked())
+            self.xray, a, e, p, use_gpu=self.form.use_gpu.isChecked(),
+            bins=bins)
         for i, radiography in enumerate(sessions):
             self.tmp_folder, session = radiography
             self.luxcore = session
             App.Console.PrintMessage("\t{} / {}\n".format(i + 1, n))
-            last_conv = -1
-            last_step = 0
-            while not session.HasDone() and self.luxcore:
-                session.UpdateStats()
-                stats = session.GetStats()
-                step = stats.Get("stats.renderengine.pass").GetInt()
-                conv = stats.Get("stats.renderengine.convergence").GetFloat()
-                App.Console.PrintMessage("\t\t{} {:.1f}%\n".format(
-                    step, 100 * conv))
-                self.form.pbar.setValue(100 * (i + conv) / n)
-                self.timer.start(0.0)
-                self.loop.exec_()
-                if(not self.luxcore):
-                    break
-                if last_conv != conv or (step - last_step >= 32):
-                    imgs = Tools.get_imgs(self.tmp_folder, session)
-                    if i == 0:
-                        # For the background image we just need one channels
-                        imgs = [imgs[0]]
-                    for j, img in enumerate(imgs):
-                        if last_conv < 0:
-                            current_image += 1
-                            self.images.append(img)
-                            self.form.image.addItem(self.titles[current_image])
-                            self.form.image.setCurrentIndex(current_image)
-                        else:
-                            self.images[j - len(imgs)] = img
-                    if self.form.image.currentIndex() == current_image:
-                        self.update_plot()
-                    last_conv = conv
-                    last_step = step
-                else:
-                    time.sleep(1.0)
-            if(not self.luxcore):
+            self.session_index = i
+            self.last_conv = -1
+            self.last_step = 0
+            self.last_print = None
+            self.last_preview = 0.0
+            # The session is polled on a separate thread, which reports the
+            # progress to on_progress()
+            done = Monitor.wait(session, on_progress=self.on_progress,
+                                running=lambda: bool(self.luxcore))
+            if not done or not self.luxcore:
                 break
             imgs = Tools.get_imgs(self.tmp_folder, session)
             session.Stop()
             if i == 0:
                 # For the background image we just need one channels
                 imgs = [imgs[0]]
-            for j, img in enumerate(imgs):
-                self.images[j - len(imgs)] = img
-            if self.form.image.currentIndex() == current_image:
-                self.update_plot()
+            # Sessions might finish before the first preview is taken
+            self.push_images(imgs, self.last_conv < 0)
 
         if self.luxcore:
             self.titles.append('Radiography')
             self.form.image.addItem(self.titles[-1])
             # Produce the final radiography
-            img = Tools.assemble_radiography(self.xray, self.images)
+            img = Tools.assemble_radiography(self.xray, self.images,
+                                             bins=bins)
             self.images.append(img)
             self.form.image.setCurrentIndex(len(self.images) - 1)
             self.update_plot()
@@ -261,6 +241,28 @@ class TaskPanel:
 
         return True
 
+    def on_progress(self, step, conv):
+        if not self.luxcore:
+            return
+        i = self.session_index
+        if self.last_print != int(1000 * conv):
+            self.last_print = int(1000 * conv)
+            App.Console.PrintMessage("\t\t{} {:.1f}%\n".format(
+                step, 100 * conv))
+        self.form.pbar.setValue(100 * (i + conv) / self.n_sessions)
+        if time.monotonic() - self.last_preview < PREVIEW_INTERVAL:
+            return
+        if self.last_conv != conv or (step - self.last_step >= 32):
+            self.last_preview = time.monotonic()
+            imgs = Tools.get_imgs(self.tmp_folder, self.luxcore,
+                                  buf=self.preview)
+            if i == 0:
+                # For the background image we just need one channels
+                imgs = [imgs[0]]
+            self.push_images(imgs, self.last_conv < 0)
+            self.last_conv = conv
+            self.last_step = step
+
     def onStop(self):
         if self.luxcore is None:
             return
@@ -269,6 +271,24 @@ class TaskPanel:
         self.luxcore.Stop()
         self.luxcore = None
 
+    def push_images(self, imgs, new):
+        """Add or refresh the images of the current session.
+
+        Keyword arguments:
+        imgs -- List of images
+        new -- True if the images should be appended, False if they are
+               replacing the last ones
+        """
+        for j, img in enumerate(imgs):
+            if new:
+                self.images.append(img)
+                self.form.image.addItem(self.titles[len(self.images) - 1])
+                self.form.image.setCurrentIndex(len(self.images) - 1)
+            else:
+                self.images[j - len(imgs)] = img
+        if self.form.image.currentIndex() == len(self.images) - 1:
+            self.update_plot()
+
     def onImage(self, i):
         self.update_plot()
 
@@ -29,11 +29,23 @@ import trimesh
 import FreeCAD as App
 from FreeCAD import Units, Vector, Mesh
 import Part
-from ..xrayUtils import LuxCore, LightUnits
+from ..xrayUtils import LuxCore, LightUnits, Projector, PlyCache
+from ..xrayUtils import BackgroundCache, SeedSplit
 
 
+ENGINES = ['luxcore', 'native']
+# The LuxCore render configuration templates, on the CPU and on the GPU. The
+# 'primary' profile just renders the unscattered beam, see README.md
+PROFILES = {
+    'full': ("render.cfg", "render_gpu.cfg"),
+    'primary': ("render_primary.cfg", "render_primary_gpu.cfg"),
+}
 LIGHT_PLY = "light.ply"
 SCREEN_PLY = "screen.ply"
+LIGHT_SHAPE = "99999999_AREA_LIGHT_SHAPE"
+SCREEN_SHAPE = "99999998_SCREEN_SHAPE"
+LIGHT_OBJ = "99999999_AREA_LIGHT_OBJ"
+SCREEN_OBJ = "99999998_SCREEN_OBJ"
 SCALE = 'm'
 CAM_TYPE = "orthographic"  # "perspective"
 MIN_INTENSITY_RATIO = 1E-6
@@ -44,12 +56,17 @@ def luxcore_templates_folder():
     return os.path.join(_dir, "..", "resources", "luxcore")
 
 
+# The templates are just read once
+TEMPLATES = {}
+
+
 def __make_template(fname, replaces):
-    txt = None
-    with open(os.path.join(luxcore_templates_folder(), fname), 'r') as f:
-        txt = f.read()
-        for key, value in replaces.items():
-            txt = txt.replace(key, value)
+    if fname not in TEMPLATES:
+        with open(os.path.join(luxcore_templates_folder(), fname), 'r') as f:
+            TEMPLATES[fname] = f.read()
+    txt = TEMPLATES[fname]
+    for key, value in replaces.items():
+        txt = txt.replace(key, value)
     return txt
 
 
@@ -58,6 +75,10 @@ def __freecad2meters(value):
 
 
 def __make_ply(obj, fname):
+    key = PlyCache.digest(obj, SCALE)
+    area = PlyCache.load(key, fname)
+    if area is not None:
+        return Units.parseQuantity('{} m^2'.format(area))
     Mesh.export([obj], fname)
     # FreeCAD exported the object in its native length units, so we must scale
     # it to meters
@@ -73,10 +94,15 @@ def __make_ply(obj, fname):
     mesh.export(fname, file_type='ply')
     sys.stdout.close()
     sys.stdout = stdout
+    PlyCache.store(key, fname, mesh.area)
     return Units.parseQuantity('{} m^2'.format(mesh.area))
 
 
 def __shape2ply(shape, fname):
+    # Avoid creating the auxiliary object if the shape is already cached
+    area = PlyCache.load(PlyCache.digest(shape, SCALE), fname)
+    if area is not None:
+        return Units.parseQuantity('{} m^2'.format(area))
     # FreeCAD will export the object in its native length units, so we must
     # scale it to meters
     Part.show(shape)
@@ -87,45 +113,105 @@ def __shape2ply(shape, fname):
     return area
 
 
-def __average_mu(obj, min_e, max_e, num=25):
-    min_e = LightUnits.to_energy(min_e)
-    max_e = LightUnits.to_energy(max_e)
-    e = []
-    for freq in obj.AttenuationFreqs:
-        e.append(
-            LightUnits.to_energy(Units.parseQuantity('{} THz'.format(freq))))
-    mu = []
-    for att in obj.AttenuationValues:
-        mu.append(
-            Units.parseQuantity('{} m^-1'.format(att)))
-    # Convert everything to floats
-    min_x = min_e.getValueAs('keV').Value
-    max_x = max_e.getValueAs('keV').Value
-    x = np.linspace(min_x, max_x, num=num)
-    xp = [ee.getValueAs('keV').Value for ee in e]
-    yp = [att.getValueAs(SCALE + '^-1').Value for att in mu]
-    # Interpolate and integrate
-    y = np.interp(x, xp, yp)
-    return np.trapz(y, x=x) / (max_x - min_x)
+def __bins_mu(obj, bins):
+    # The averaged absortions on each bin, as a numpy array
+    return obj.Proxy.average_mu(obj, bins, scale=SCALE)
 
 
-def radiography(xray, angle, max_error, power,
-                tmppath=None, background=True, use_gpu=False):
-    # Create a temporal folder
-    tmppath = tmppath or tempfile.mkdtemp()
-    print(tmppath)
+def detector_size(xray):
+    """The width and height of the orthographic camera screen window, i.e.
+    the detector size
+
+    Keyword arguments:
+    xray -- The X-Ray machine
+
+    Returns:
+    The detector width and height, in SCALE units
+    """
+    cam_w = 0.5 * xray.ChamberRadius.getValueAs(SCALE).Value
+    cam_h = 0.5 * xray.ChamberHeight.getValueAs(SCALE).Value
+    return cam_w, cam_h
+
+
+def __group_mu(obj, bins, i):
+    # The averaged absortions of the i-th group of 3 samples
+    return list(__bins_mu(obj, bins)[3 * i:3 * (i + 1)])
+
+
+def __export_objs(xray, tmppath):
+    fnames = []
+    for i, obj in enumerate(xray.ScanObjects):
+        fname = os.path.join(tmppath, "mesh.{:05d}.ply".format(i))
+        fnames.append(fname)
+        if os.path.isfile(fname):
+            continue
+        __make_ply(obj.Source, fname)
+    return fnames
+
+
+def __mesh_arrays(fname):
+    mesh = trimesh.load(fname, force='mesh')
+    return mesh.vertices, mesh.faces
 
-    # Setup the light and the screen meshes
-    light = xray.Proxy.light(xray)
-    light = light.rotate((0, 0, 0), (0, 0, 1), angle)
-    light_area = __shape2ply(light, os.path.join(tmppath, LIGHT_PLY))
-    cam_dist = 0.5 * xray.ChamberDistance
-    screen = xray.Proxy.screen(xray)
-    # screen = screen.translate((cam_dist, 0, 0))
-    screen = screen.rotate((0, 0, 0), (0, 0, 1), angle)
-    __shape2ply(screen, os.path.join(tmppath, SCREEN_PLY))
 
+def __radians(angle):
+    try:
+        return angle.getValueAs('rad').Value
+    except AttributeError:
+        return np.radians(angle)
+
+
+def sensor_resolution(xray, resolution=None):
+    """The resolution the radiographies are rendered with
+
+    Keyword arguments:
+    xray -- The X-Ray machine
+    resolution -- The (x, y) resolution overriding the machine one, e.g.
+                  for previews. None to use the machine one
+
+    Returns:
+    The (x, y) resolution
+    """
+    if resolution is not None:
+        return tuple(resolution)
+    return xray.SensorResolutionX, xray.SensorResolutionY
+
+
+def __native_radiography(xray, angle, tmppath, background, bins,
+                         resolution):
+    res_x, res_y = resolution
+    shape = (res_y, res_x)
+    if background:
+        # Without scattering the flat field is just the unattenuated beam
+        bkg = np.ones(shape, dtype=np.float32)
+        yield tmppath, Projector.Session([bkg, bkg, bkg])
+
+    cam_w, cam_h = detector_size(xray)
+    origins, directions = Projector.rays(
+        xray.EmitterType, xray.ChamberDistance.getValueAs(SCALE).Value,
+        cam_w, cam_h, res_x, res_y,
+        __radians(angle))
+    lengths = []
+    for fname in __export_objs(xray, tmppath):
+        mesh = trimesh.load(fname, force='mesh')
+        # The path lengths computation requires outwards normals
+        mesh.fix_normals()
+        lengths.append(Projector.path_lengths(
+            origins, directions, mesh.vertices, mesh.faces).reshape(shape))
+
+    objs = xray.ScanObjects
+    for i in range(len(bins) // 3):
+        mus = [__group_mu(obj, bins, i) for obj in objs]
+        imgs = []
+        for k in range(3):
+            img = Projector.transmission(lengths, [mu[k] for mu in mus])
+            imgs.append(np.asarray(img, dtype=np.float32))
+        yield tmppath, Projector.Session(imgs)
+
+
+def __camera_replaces(xray, angle):
     # Get the camera position and target
+    cam_dist = 0.5 * xray.ChamberDistance
     # cam_pos = Vector(0.5 * xray.ChamberDistance, 0, 0)
     # cam_target = cam_pos + Vector(cam_dist, 0, 0)
     cam_target = Vector(0.5 * xray.ChamberDistance, 0, 0)
@@ -141,10 +227,107 @@ def radiography(xray, angle, max_error, power,
         ratio = cam_dist / (0.5 * xray.ChamberRadius.getValueAs(SCALE))
         field_of_view = np.degrees(np.arctan(ratio.Value))
     else:
-        cam_w = 0.5 * xray.ChamberRadius.getValueAs(SCALE).Value
-        cam_h = 0.5 * xray.ChamberHeight.getValueAs(SCALE).Value
+        cam_w, cam_h = detector_size(xray)
         field_of_view = 45.0
 
+    return {
+        "@CAM_NEAR@": "{}".format(cam_near.getValueAs(SCALE).Value),
+        "@CAM_POS@": "{} {} {}".format(__freecad2meters(cam_pos.X),
+                                       __freecad2meters(cam_pos.Y),
+                                       __freecad2meters(cam_pos.Z)),
+        "@CAM_TARGET@": "{} {} {}".format(__freecad2meters(cam_target.X),
+                                          __freecad2meters(cam_target.Y),
+                                          __freecad2meters(cam_target.Z)),
+        "@SCREEN_BOUNDS@": "{} {} {} {}".format(-0.5 * cam_w,
+                                                0.5 * cam_w,
+                                                -0.5 * cam_h,
+                                                0.5 * cam_h),
+        "@CAM_TYPE@": "{}".format(CAM_TYPE),
+        "@FIELD_OF_VIEW@": "{}".format(field_of_view),
+        "@LIGHT_POS@": "{} {} {}".format(-__freecad2meters(cam_pos.X),
+                                         -__freecad2meters(cam_pos.Y),
+                                         -__freecad2meters(cam_pos.Z)),
+        "@LIGHT_TARGET@": "{} {} {}".format(-__freecad2meters(cam_target.X),
+                                            -__freecad2meters(cam_target.Y),
+                                            -__freecad2meters(cam_target.Z)),
+        "@AREA_LIGHT_SHAPE@" : LIGHT_SHAPE,
+        "@SCREEN_SHAPE@" : SCREEN_SHAPE,
+    }
+
+
+def rotate(xray, session, angle, angle0):
+    """Rotates the X-Ray machine of a LuxCore session yielded by
+    radiography(), editing its scene in place. The rendering is restarted
+
+    Keyword arguments:
+    xray -- The X-Ray machine
+    session -- The LuxCore session
+    angle -- The new angle
+    angle0 -- The angle passed to radiography() when the session was created
+    """
+    scn = __make_template("scene.scn", __camera_replaces(xray, angle))
+    # The camera is parsed again, while the light and screen meshes, which
+    # were exported at angle0, are just transformed
+    lines = [l for l in scn.splitlines() if l.startswith(
+        ("scene.camera.",
+         "scene.objects." + LIGHT_OBJ + ".",
+         "scene.objects." + SCREEN_OBJ + "."))]
+    rot = Projector.rotation(__radians(angle) - __radians(angle0))
+    # LuxCore matrices are column-major
+    mat = rot.flatten(order='F')
+    for obj in (LIGHT_OBJ, SCREEN_OBJ):
+        lines.append("scene.objects.{}.transformation = {}".format(
+            obj, " ".join(["{}".format(m) for m in mat])))
+    LuxCore.edit_scene(session, LuxCore.properties("\n".join(lines)))
+
+
+def __run_scene(tmppath, cfg, scene, pyluxcore, seeds, max_error, threads):
+    if seeds < 2:
+        return LuxCore.run_scene(tmppath, cfg, scene, pyluxcore)
+    # Each render gets its own exported scene
+    folder = tempfile.mkdtemp(dir=tmppath)
+    return SeedSplit.start(folder, cfg, scene, seeds, max_error,
+                           threads=threads // seeds, pyluxcore=pyluxcore)
+
+
+def radiography(xray, angle, max_error, power,
+                tmppath=None, background=True, use_gpu=False,
+                engine='luxcore', threads=0, bins=None, seeds=1,
+                profile='full', resolution=None):
+    # Create a temporal folder
+    tmppath = tmppath or tempfile.mkdtemp()
+    bins = bins or spectral_bins(xray)
+    resolution = sensor_resolution(xray, resolution)
+
+    if engine == 'native':
+        yield from __native_radiography(xray, angle, tmppath, background,
+                                        bins, resolution)
+        return
+    elif engine != 'luxcore':
+        raise ValueError('Unknown engine "{}"'.format(engine))
+    if profile not in PROFILES:
+        raise ValueError('Unknown profile "{}"'.format(profile))
+    bkg_key = BackgroundCache.digest(xray, power, max_error,
+                                     resolution=resolution, engine=engine,
+                                     use_gpu=use_gpu, profile=profile,
+                                     seeds=seeds)
+
+    pyluxcore = LuxCore.init()
+
+    # Setup the light and the screen meshes
+    light = xray.Proxy.light(xray)
+    light = light.rotate((0, 0, 0), (0, 0, 1), angle)
+    light_area = __shape2ply(light, os.path.join(tmppath, LIGHT_PLY))
+    screen = xray.Proxy.screen(xray)
+    # screen = screen.translate((cam_dist, 0, 0))
+    screen = screen.rotate((0, 0, 0), (0, 0, 1), angle)
+    __shape2ply(screen, os.path.join(tmppath, SCREEN_PLY))
+    # LuxCore will take the meshes from memory
+    meshes = {
+        LIGHT_SHAPE: __mesh_arrays(os.path.join(tmppath, LIGHT_PLY)),
+        SCREEN_SHAPE: __mesh_arrays(os.path.join(tmppath, SCREEN_PLY)),
+    }
+
     # Laser mode
     collimation = xray.EmitterCollimation.getValueAs('deg').Value
     min_collimation = 1.0 if use_gpu else 0.1
@@ -165,78 +348,54 @@ def radiography(xray, angle, max_error, power,
     # Setup the templates for the background/empty image
     max_error = max(max_error.Value, 0) * power
     replaces = {
-        "@WIDTH_OUTPUT@": "{}".format(xray.SensorResolutionX),
-        "@HEIGHT_OUTPUT@": "{}".format(xray.SensorResolutionY),
+        "@WIDTH_OUTPUT@": "{}".format(resolution[0]),
+        "@HEIGHT_OUTPUT@": "{}".format(resolution[1]),
         "@MAX_ERROR@": "{}".format(max_error),
     }
-    template_file = "render_gpu.cfg" if use_gpu else "render.cfg"
-    with open(os.path.join(tmppath, "render.cfg"), 'w') as f:
-        f.write(__make_template(template_file, replaces))
-
-    replaces = {
-        "@CAM_NEAR@": "{}".format(cam_near.getValueAs(SCALE).Value),
-        "@CAM_POS@": "{} {} {}".format(__freecad2meters(cam_pos.X),
-                                       __freecad2meters(cam_pos.Y),
-                                       __freecad2meters(cam_pos.Z)),
-        "@CAM_TARGET@": "{} {} {}".format(__freecad2meters(cam_target.X),
-                                          __freecad2meters(cam_target.Y),
-                                          __freecad2meters(cam_target.Z)),
-        "@SCREEN_BOUNDS@": "{} {} {} {}".format(-0.5 * cam_w,
-                                                0.5 * cam_w,
-                                                -0.5 * cam_h,
-                                                0.5 * cam_h),
-        "@CAM_TYPE@": "{}".format(CAM_TYPE),
-        "@FIELD_OF_VIEW@": "{}".format(field_of_view),
-        "@LIGHT_POS@": "{} {} {}".format(-__freecad2meters(cam_pos.X),
-                                         -__freecad2meters(cam_pos.Y),
-                                         -__freecad2meters(cam_pos.Z)),
-        "@LIGHT_TARGET@": "{} {} {}".format(-__freecad2meters(cam_target.X),
-                                            -__freecad2meters(cam_target.Y),
-                                            -__freecad2meters(cam_target.Z)),
+    template_file = PROFILES[profile][1 if use_gpu else 0]
+    cfg = LuxCore.properties(__make_template(template_file, replaces),
+                             pyluxcore)
+    if threads:
+        cfg.Set(pyluxcore.Property("native.threads.count", threads))
+
+    replaces = __camera_replaces(xray, angle)
+    replaces.update({
         "@LIGHT_RADIUS@": "{}".format(light_radius.getValueAs(SCALE).Value),
         "@POWER@" : "{}".format(power),
         "@COLLIMATION@" : "{}".format(
             xray.EmitterCollimation.getValueAs('deg').Value),
-        "@AREA_LIGHT_PLY@" : LIGHT_PLY,
-        "@SCREEN_PLY@" : SCREEN_PLY,
-    }
+    })
     template_file = "scene_laser.scn" if is_laser else "scene.scn"
     scn = __make_template("scene.scn", replaces)
-    with open(os.path.join(tmppath, "scene.scn"), 'w') as f:
-        f.write(scn)
 
-    if background:
+    bkg = BackgroundCache.load(bkg_key) if background else None
+    if bkg is not None:
+        # The very same empty chamber was already rendered
+        yield tmppath, Projector.Session([bkg, bkg, bkg])
+    elif background:
         # We are ready for the background simulation!
-        yield tmppath, LuxCore.run_sim(tmppath, scn="scene.scn")
+        scene = LuxCore.make_scene(LuxCore.properties(scn, pyluxcore),
+                                   meshes, pyluxcore)
+        session = __run_scene(tmppath, cfg, scene, pyluxcore, seeds,
+                              max_error, threads)
+        yield tmppath, session
+        # Keep it for the future, unless the render was interrupted
+        if session.HasDone():
+            BackgroundCache.store(bkg_key, get_imgs(tmppath, session)[0])
 
     # Now we should add a scene per tuple of sampled frequencies (in groups of
     # 3). We can start exporting the objects
     objs = xray.ScanObjects
-    for i, obj in enumerate(objs):
-        fname = os.path.join(tmppath, "mesh.{:05d}.ply".format(i))
-        if os.path.isfile(fname):
-            continue
-        __make_ply(obj.Source, fname)
+    for j, fname in enumerate(__export_objs(xray, tmppath)):
+        meshes["mesh.{:05d}".format(j)] = __mesh_arrays(fname)
 
     # And now we can traverse the groups of samples
-    n_samples = xray.EmitterSamples
-    if n_samples % 3:
-        n_samples = 3 * (n_samples // 3 + 1)
-    e0 = LightUnits.to_energy(xray.EmitterMinFreq)
-    e1 = LightUnits.to_energy(xray.EmitterMaxFreq)
-    de = (e1 - e0) / (n_samples + 1)
-    n_samples //= 3
     scn_org = scn
-    for i in range(n_samples):
+    for i in range(len(bins) // 3):
         scn = scn_org
         for j, obj in enumerate(objs):
             # Compute the absortions
-            mu = []
-            for k in range(3):
-                kk = i * 3 + k
-                e_min = e0 + kk * de
-                e_max = e0 + (kk + 1) * de
-                mu.append(__average_mu(obj, e_min, e_max))
+            mu = __group_mu(obj, bins, i)
             replaces = {
                 "@VOL_ID@": "{}".format(1000000 + j),
                 "@MAT_ID@": "{}".format(2000000 + j),
@@ -244,21 +403,23 @@ def radiography(xray, angle, max_error, power,
                 "@ATTENUATION@": "{} {} {}".format(mu[0],
                                                    mu[1],
                                                    mu[2]),
-                "@OBJ_PLY@": "mesh.{:05d}.ply".format(j),
+                "@OBJ_SHAPE@": "mesh.{:05d}".format(j),
             }
             scn = scn + __make_template("object.scn", replaces)
-        scn_name = "sample.{}.scn".format(i)
-        with open(os.path.join(tmppath, scn_name), 'w') as f:
-            f.write(scn)
 
-        # We are ready for the background simulation!
-        yield tmppath, LuxCore.run_sim(tmppath, scn=scn_name)
+        # We are ready for the simulation!
+        scene = LuxCore.make_scene(LuxCore.properties(scn, pyluxcore),
+                                   meshes, pyluxcore)
+        yield tmppath, __run_scene(tmppath, cfg, scene, pyluxcore, seeds,
+                                   max_error, threads)
 
     
-def get_imgs(folder, session=None):
-    if session is None:
-        return LuxCore.get_imgs(folder)
-    return LuxCore.get_imgs(folder, session)
+def get_imgs(folder, session=None, buf=None, export=False):
+    if isinstance(session, Projector.Session):
+        return session.get_imgs()
+    if isinstance(session, SeedSplit.Session):
+        return session.get_imgs(buf=buf)
+    return LuxCore.get_imgs(folder, session, buf=buf, export=export)
 
 
 def __discretize_spectrum(xray):
@@ -284,9 +445,133 @@ def __discretize_spectrum(xray):
     return weights
 
 
-def assemble_radiography(xray, images):
-    imgs = [img / images[0] for img in images[1:]]
+def spectral_bins(xray):
+    """Splits the emitter spectrum in EmitterSamples uniform bins
+
+    Keyword arguments:
+    xray -- The X-Ray machine
+
+    Returns:
+    The list of bins, as tuples with the minimum and maximum energies (keV)
+    and the spectral weight. The length of the list is a multiple of 3,
+    since each render is computing 3 bins
+    """
+    e0 = LightUnits.to_energy(xray.EmitterMinFreq).getValueAs('keV').Value
+    e1 = LightUnits.to_energy(xray.EmitterMaxFreq).getValueAs('keV').Value
     weights = __discretize_spectrum(xray)
+    de = (e1 - e0) / (len(weights) + 1)
+    return [(e0 + i * de, e0 + (i + 1) * de, w) for i, w in enumerate(weights)]
+
+
+def __max_path(obj):
+    # The largest length a ray might travel inside the object
+    try:
+        bbox = obj.Source.Mesh.BoundBox
+    except AttributeError:
+        bbox = obj.Source.Shape.BoundBox
+    return __freecad2meters(bbox.DiagonalLength)
+
+
+def adaptive_spectral_bins(xray, max_error=0.01):
+    """Reduces the spectral bins of spectral_bins(), dropping the ones with
+    the lowest spectral weight and merging the neighbours with similar
+    attenuations, as far as the estimated error is below the given budget.
+
+    The error of dropping a bin is its normalized weight. The error of
+    merging bins is estimated along the longest path in each object, as the
+    difference between the weighted transmissions of the original bins and
+    the transmission with the attenuation the merged bin is rendered with,
+    i.e. the one averaged on the whole merged energy range.
+
+    Keyword arguments:
+    xray -- The X-Ray machine
+    max_error -- The error budget, relative to the unattenuated intensity
+
+    Returns:
+    The list of bins, in the same format of spectral_bins(), and the
+    estimated error accepted
+    """
+    bins = spectral_bins(xray)
+    W = sum([w for _, _, w in bins]) or 1.0
+    objs = xray.ScanObjects
+    lengths = np.array([__max_path(obj) for obj in objs])
+    mus = np.array([__bins_mu(obj, bins) for obj in objs]).reshape(
+        len(objs), len(bins))
+    # Each item is a bin to be rendered, with its original bins and their
+    # error, as [e_min, e_max, weight, [(weight, mu), ...], error]
+    items = []
+    for (e_min, e_max, w), mu in zip(bins, mus.T):
+        items.append([e_min, e_max, w / W, [(w / W, mu)], 0.0])
+
+    # Drop the less relevant bins, using up to half of the budget
+    error = 0.0
+    keep = list(range(len(items)))
+    for k in sorted(keep, key=lambda k: items[k][2]):
+        if len(keep) == 1 or error + items[k][2] > 0.5 * max_error:
+            break
+        error += items[k][2]
+        keep.remove(k)
+    items = [items[k] for k in keep]
+
+    def merge_error(parts, mu):
+        # Transmission error of rendering the original bins with mu
+        t = np.exp(-mu * lengths)
+        diff = sum([w * (np.exp(-m * lengths) - t) for w, m in parts])
+        return float(np.max(np.abs(diff), initial=0.0))
+
+    # Merge the cheapest couple of neighbours, while the budget allows it
+    while len(items) > 1:
+        ranges = [(items[k][0], items[k + 1][1])
+                  for k in range(len(items) - 1)]
+        merged_mus = np.array([__bins_mu(obj, ranges) for obj in objs])
+        merged_mus = merged_mus.reshape(len(objs), len(ranges))
+        merged = []
+        for k in range(len(ranges)):
+            parts = items[k][3] + items[k + 1][3]
+            e = merge_error(parts, merged_mus[:, k])
+            merged.append((e - items[k][4] - items[k + 1][4], parts, e))
+        k = int(np.argmin([cost for cost, _, _ in merged]))
+        cost, parts, e = merged[k]
+        if error + cost > max_error:
+            break
+        error += cost
+        a, b = items[k], items[k + 1]
+        items[k:k + 2] = [[a[0], b[1], a[2] + b[2], parts, e]]
+
+    bins = [(item[0], item[1], item[2]) for item in items]
+    # Fill the last render with void bins
+    while len(bins) % 3:
+        bins.append((bins[-1][0], bins[-1][1], 0.0))
+    App.Console.PrintMessage(
+        "{} spectral bins ({} renders), estimated error {:.3g}\n".format(
+            len(items), len(bins) // 3, error))
+    return bins, error
+
+
+def select_bins(xray, spectral_error=0.0):
+    """Gets the spectral bins to be rendered. The same bins shall be passed
+    to radiography() (or xrayCT.Tools.sinogram()) and to
+    assemble_radiography()
+
+    Keyword arguments:
+    xray -- The X-Ray machine
+    spectral_error -- The error budget of adaptive_spectral_bins(). 0 to
+                      render the uniform spectral_bins()
+
+    Returns:
+    The list of bins, in the same format of spectral_bins()
+    """
+    if spectral_error <= 0.0:
+        return spectral_bins(xray)
+    return adaptive_spectral_bins(xray, spectral_error)[0]
+
+
+def assemble_radiography(xray, images, bins=None):
+    imgs = [img / images[0] for img in images[1:]]
+    if bins is None:
+        weights = __discretize_spectrum(xray)
+    else:
+        weights = [w for _, _, w in bins]
 
     W = 0
     res = np.zeros(images[0].shape, dtype=images[0].dtype)
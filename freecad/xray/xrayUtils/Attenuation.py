@@ -0,0 +1,53 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import numpy as np
+
+
+def average(energies, attenuations, bins, num=25):
+    """Averaged attenuations on a set of energy bins. The attenuations are
+    interpolated in log-log scale, since they roughly follow a power law
+    between the absorption edges.
+
+    Keyword arguments:
+    energies -- The sorted energies of the attenuation table.
+    attenuations -- The attenuations of the table.
+    bins -- List of bins, as tuples with the minimum and maximum
+    energies, and optionally any other item.
+    num -- Number of integration points on each bin.
+
+    Returns:
+    The array of averaged attenuations, one per bin.
+    """
+    tiny = np.finfo(np.float64).tiny
+    log_ep = np.log(np.maximum(np.asarray(energies, dtype=np.float64), tiny))
+    log_mup = np.log(np.maximum(np.asarray(attenuations, dtype=np.float64),
+                                tiny))
+    e_min = np.array([b[0] for b in bins], dtype=np.float64)
+    e_max = np.array([b[1] for b in bins], dtype=np.float64)
+    x = e_min[:, np.newaxis] + np.outer(e_max - e_min,
+                                        np.linspace(0.0, 1.0, num=num))
+    y = np.exp(np.interp(np.log(np.maximum(x, tiny)), log_ep, log_mup))
+    # Trapezoidal rule, along the integration points of each bin
+    area = 0.5 * np.sum((y[:, 1:] + y[:, :-1]) * np.diff(x, axis=1), axis=1)
+    de = np.where(e_max > e_min, e_max - e_min, 1.0)
+    return np.where(e_max > e_min, area / de, y[:, 0])
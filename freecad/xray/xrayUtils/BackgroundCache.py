@@ -0,0 +1,150 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import os
+import json
+import hashlib
+import numpy as np
+from . import Cache, Files, PlyCache
+
+
+# Bump it whenever the background renders change
+CACHE_VERSION = 1
+# Maximum size of the cache, in bytes
+MAX_SIZE = 256 * 1024 * 1024
+SUFFIX = ".npy"
+STATS = {'hits': 0, 'misses': 0, 'stores': 0}
+
+
+def folder(path=None):
+    """Returns the folder where the background images are stored, creating
+    it if it does not exist yet
+
+    Keyword arguments:
+    path -- The parent folder. If None, App.getUserAppDataDir() will be used
+
+    Returns:
+    The cache folder
+    """
+    if path is None:
+        import FreeCAD as App
+        path = App.getUserAppDataDir()
+    path = os.path.join(path, 'XRay', 'bkg_cache')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def digest(xray, power, max_error, resolution=None, tessellation=None,
+           **kwargs):
+    """Hash of the parameters a background image depends on. The scanned
+    objects are not considered, and neither is the angle, since the empty
+    chamber is symmetric
+
+    Keyword arguments:
+    xray -- The X-Ray machine
+    power -- The emitter power
+    max_error -- The render error target
+    resolution -- The (x, y) sensor resolution, None for the machine one
+    tessellation -- The settings the emitter and the sensor are tessellated
+                    with. None for the current ones, see
+                    PlyCache.export_settings()
+    kwargs -- Any other render option, like the engine or the GPU usage
+
+    Returns:
+    The hexadecimal hash string
+    """
+    res_x, res_y = resolution or (xray.SensorResolutionX,
+                                  xray.SensorResolutionY)
+    params = {
+        'version': CACHE_VERSION,
+        'emitter': xray.EmitterType,
+        'collimation': xray.EmitterCollimation.getValueAs('deg').Value,
+        'radius': xray.ChamberRadius.getValueAs('m').Value,
+        'height': xray.ChamberHeight.getValueAs('m').Value,
+        'distance': xray.ChamberDistance.getValueAs('m').Value,
+        'res_x': res_x,
+        'res_y': res_y,
+        'power': power.getValueAs('W').Value,
+        'max_error': max_error.Value,
+        'tessellation': tessellation or PlyCache.export_settings(),
+    }
+    params.update(kwargs)
+    txt = json.dumps(params, sort_keys=True)
+    return hashlib.sha1(txt.encode()).hexdigest()
+
+
+def load(key, path=None):
+    """Get a cached background image
+
+    Keyword arguments:
+    key -- The digest() of the render parameters
+    path -- The cache parent folder. See folder()
+
+    Returns:
+    The image, None if it is not cached
+    """
+    path = folder(path)
+    img = None
+    if Cache.lookup(path, key, SUFFIX) is not None:
+        try:
+            img = np.load(Cache.entry(path, key, SUFFIX))
+        except (OSError, ValueError):
+            # Evicted meanwhile
+            pass
+    STATS['misses' if img is None else 'hits'] += 1
+    return img
+
+
+def store(key, img, path=None, max_size=MAX_SIZE):
+    """Add a background image to the cache, evicting the least recently
+    used ones if the cache grows too large
+
+    Keyword arguments:
+    key -- The digest() of the render parameters
+    img -- The background image
+    path -- The cache parent folder. See folder()
+    max_size -- The maximum size of the cache, in bytes
+    """
+    path = folder(path)
+    fname = Cache.entry(path, key, SUFFIX)
+    with Files.atomic_file(fname) as f:
+        np.save(f, np.asarray(img, dtype=np.float32))
+    STATS['stores'] += 1
+    Cache.add(path, key, {'size': os.path.getsize(fname)}, SUFFIX, max_size)
+
+
+def stats():
+    """Returns the cache usage statistics of this session
+
+    Returns:
+    Dictionary with the number of hits, misses and stored images
+    """
+    return dict(STATS)
+
+
+def clear(path=None):
+    """Remove all the cached images
+
+    Keyword arguments:
+    path -- The cache parent folder. See folder()
+    """
+    Cache.clear(folder(path), SUFFIX)
@@ -0,0 +1,155 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+# On disk caches shared by several processes. The entries are files, or
+# folders, named after their keys and listed on an index file with their
+# sizes. The index changes are serialized with a file lock, while the last
+# access time of an entry is its modification time, so the cache hits are
+# not rewriting the index
+
+
+import os
+import shutil
+import json
+from . import Files
+
+
+INDEX = "index.json"
+LOCK = "index.lock"
+
+
+def entry(path, key, suffix=''):
+    """Path of a cache entry
+
+    Keyword arguments:
+    path -- The cache folder
+    key -- The entry key
+    suffix -- The entry file extension, empty for folders
+
+    Returns:
+    The entry path
+    """
+    return os.path.join(path, key + suffix)
+
+
+def load_index(path):
+    """Reads the cache index
+
+    Keyword arguments:
+    path -- The cache folder
+
+    Returns:
+    Dictionary with the entries data by key
+    """
+    try:
+        with open(os.path.join(path, INDEX), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def __save_index(path, index):
+    with Files.atomic_file(os.path.join(path, INDEX), 'w') as f:
+        json.dump(index, f)
+
+
+def lookup(path, key, suffix=''):
+    """Get an entry data, marking it as the most recently used one
+
+    Keyword arguments:
+    path -- The cache folder
+    key -- The entry key
+    suffix -- The entry file extension, empty for folders
+
+    Returns:
+    The entry data, None if it is not cached
+    """
+    data = load_index(path).get(key, None)
+    if data is None:
+        return None
+    try:
+        os.utime(entry(path, key, suffix))
+    except OSError:
+        # Evicted meanwhile
+        return None
+    return data
+
+
+def add(path, key, data, suffix='', max_size=None):
+    """Lists an entry already written on the cache folder, evicting the
+    least recently used ones if the cache grows too large
+
+    Keyword arguments:
+    path -- The cache folder
+    key -- The entry key
+    data -- The entry data. It shall have a 'size' field, in bytes
+    suffix -- The entry file extension, empty for folders
+    max_size -- The maximum size of the cache, in bytes. None to not evict
+                entries
+    """
+    with Files.lock(os.path.join(path, LOCK)):
+        index = load_index(path)
+        index[key] = data
+        if max_size is not None:
+            __evict(path, index, suffix, max_size)
+        __save_index(path, index)
+
+
+def __atime(path, key, suffix):
+    try:
+        return os.path.getmtime(entry(path, key, suffix))
+    except OSError:
+        return None
+
+
+def __evict(path, index, suffix, max_size):
+    atimes = {key: __atime(path, key, suffix) for key in index}
+    # The entries removed by hand are just forgotten
+    for key in [key for key, atime in atimes.items() if atime is None]:
+        index.pop(key)
+        atimes.pop(key)
+    size = sum([data['size'] for data in index.values()])
+    for key in sorted(index, key=lambda k: atimes[k]):
+        if size <= max_size:
+            break
+        size -= index.pop(key)['size']
+        fname = entry(path, key, suffix)
+        if os.path.isdir(fname):
+            shutil.rmtree(fname, ignore_errors=True)
+        else:
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+
+
+def clear(path, suffix=''):
+    """Remove all the cache entries
+
+    Keyword arguments:
+    path -- The cache folder
+    suffix -- The entries file extension, empty for folders
+    """
+    with Files.lock(os.path.join(path, LOCK)):
+        index = load_index(path)
+        __evict(path, index, suffix, 0)
+        __save_index(path, index)
@@ -0,0 +1,148 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import os
+import json
+import shutil
+import numpy as np
+from . import Files
+
+
+MANIFEST = "manifest.json"
+
+
+def atomic_save(fname, arr):
+    """Saves an array as a .npy file, writing it first on a temporal file
+    which is renamed afterwards, so a crash never leaves a corrupted file
+
+    Keyword arguments:
+    fname -- The file path
+    arr -- The array
+    """
+    with Files.atomic_file(fname) as f:
+        np.save(f, arr)
+
+
+def remove(folder):
+    """Removes a scan folder, once the scan is finished and its projections
+    are not required anymore
+
+    Keyword arguments:
+    folder -- The scan folder
+    """
+    shutil.rmtree(folder, ignore_errors=True)
+
+
+class Checkpoint:
+    def __init__(self, folder, params):
+        """Scan folder where the finished projections are saved, so an
+        interrupted scan can be resumed. If the folder was created by a
+        scan with different parameters it is started from scratch
+
+        Keyword arguments:
+        folder -- The scan folder
+        params -- Dictionary of the JSON serializable parameters the
+                  projections depend on
+        """
+        self.folder = folder
+        self.params = json.loads(json.dumps(params))
+        os.makedirs(os.path.join(folder, 'projections'), exist_ok=True)
+        manifest = self.__load_manifest()
+        if manifest.get('params', None) != self.params:
+            manifest = {'params': self.params, 'done': [],
+                        'background': False}
+        self.done = set(manifest['done'])
+        self.background = manifest['background']
+        self.__save_manifest()
+
+    def __load_manifest(self):
+        try:
+            with open(os.path.join(self.folder, MANIFEST), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def __save_manifest(self):
+        # Write and rename, so a crash never leaves a corrupted manifest
+        fname = os.path.join(self.folder, MANIFEST)
+        with open(fname + '.tmp', 'w') as f:
+            json.dump({'params': self.params,
+                       'done': sorted(self.done),
+                       'background': self.background}, f)
+        os.replace(fname + '.tmp', fname)
+
+    def pending(self, indexes):
+        """Filters out the finished projections
+
+        Keyword arguments:
+        indexes -- The projection indexes, in the rendering order
+
+        Returns:
+        The indexes of the projections to be rendered, in the same order
+        """
+        return [i for i in indexes if i not in self.done]
+
+    def __fname(self, i):
+        return os.path.join(self.folder, 'projections', '{:05d}.npy'.format(i))
+
+    def store(self, i, img):
+        """Saves a finished projection
+
+        Keyword arguments:
+        i -- The projection index
+        img -- The projection
+        """
+        atomic_save(self.__fname(i), np.asarray(img))
+        self.done.add(int(i))
+        self.__save_manifest()
+
+    def load(self, i):
+        """Loads a finished projection
+
+        Keyword arguments:
+        i -- The projection index
+
+        Returns:
+        The projection
+        """
+        return np.load(self.__fname(i))
+
+    def store_background(self, img):
+        """Saves the background image
+
+        Keyword arguments:
+        img -- The background image
+        """
+        atomic_save(os.path.join(self.folder, 'background.npy'),
+                     np.asarray(img))
+        self.background = True
+        self.__save_manifest()
+
+    def load_background(self):
+        """Loads the background image
+
+        Returns:
+        The background image, None if it was not saved yet
+        """
+        if not self.background:
+            return None
+        return np.load(os.path.join(self.folder, 'background.npy'))
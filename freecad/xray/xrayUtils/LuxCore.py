@@ -38,7 +38,12 @@ URIS = {
     "darwin" : LUXCORE_LATEST + "luxcorerender-latest-mac64.dmg",
     "windows" : LUXCORE_LATEST + "luxcorerender-latest-win64.zip",
 }
-CURRENT_SESSION = None
+# The properties holding file paths, which are made absolute to not depend on
+# the current working directory
+PATH_SUFFIXES = ('.file', '.filename', '.ply')
+# The image pipeline of the denoised film, and its output file
+OIDN_PIPELINE = 1
+OIDN_EXR = "oidn.exr"
 
 
 loggerName = "pyluxcore.tools"
@@ -116,39 +121,228 @@ def download(folder=None):
 
 
 def run_sim(folder, cfg="render.cfg", scn="scene.scn", pyluxcore=None,
-            refresh_interval=2500):
+            refresh_interval=2500, props=None):
+    """Launches a render session from the configuration and scene files
+
+    Keyword arguments:
+    folder -- The folder where the files are, and where the outputs are
+              written
+    cfg -- The render configuration file name
+    scn -- The scene file name
+    pyluxcore -- The luxcore library. If None, download() will be used
+    refresh_interval -- The screen refresh interval
+    props -- pyluxcore.Properties overriding the configuration ones. None
+             to use the configuration file as is
+
+    Returns:
+    The started RenderSession
+    """
+    pyluxcore = init(pyluxcore)
+    folder = os.path.abspath(folder)
+    cfg_props = absolute_paths(
+        pyluxcore.Properties(os.path.join(folder, cfg)), folder, pyluxcore)
+    cfg_props.Set(pyluxcore.Property("screen.tool.type", "IMAGE_VIEW"))
+    if props is not None:
+        cfg_props.Set(props)
+    # The scene is parsed here, so the meshes are read from folder instead of
+    # the current working directory
+    scn_props = absolute_paths(
+        pyluxcore.Properties(os.path.join(folder, scn)), folder, pyluxcore)
+    scene = pyluxcore.Scene()
+    scene.Parse(scn_props)
+    return run_scene(folder, cfg_props, scene, pyluxcore, refresh_interval)
+
+
+class RenderSession:
+    def __init__(self, session, folder):
+        """A LuxCore render session, which owns its outputs folder. Several
+        of them can run at the same time on different threads, since there
+        is not any process wide state involved
+
+        Keyword arguments:
+        session -- The started pyluxcore.RenderSession
+        folder -- The folder where the outputs are written
+        """
+        self.session = session
+        self.folder = os.path.abspath(folder)
+
+    def __getattr__(self, name):
+        # HasDone(), UpdateStats(), GetStats(), GetFilm(), Stop()... are
+        # forwarded to the pyluxcore session
+        return getattr(self.__dict__['session'], name)
+
+    def get_imgs(self, buf=None, export=False, pyluxcore=None):
+        """Reads the denoised film. See get_imgs()"""
+        return get_imgs(self.folder, self, buf=buf, export=export,
+                        pyluxcore=pyluxcore)
+
+
+def absolute_paths(props, folder, pyluxcore=None):
+    """Makes absolute the relative file paths of a set of properties, like
+    the film outputs or the meshes
+
+    Keyword arguments:
+    props -- The pyluxcore.Properties, which are modified
+    folder -- The folder the relative paths are referred to
+    pyluxcore -- The luxcore library. If None, download() will be used
+
+    Returns:
+    The modified pyluxcore.Properties
+    """
+    pyluxcore = pyluxcore or download()
+    for name in props.GetAllNames():
+        if not name.endswith(PATH_SUFFIXES):
+            continue
+        path = props.Get(name).GetString()
+        if path and not os.path.isabs(path):
+            props.Set(pyluxcore.Property(name, os.path.join(folder, path)))
+    return props
+
+
+def init(pyluxcore=None):
+    """Initializes LuxCore, downloading it if required
+
+    Keyword arguments:
+    pyluxcore -- The luxcore library. If None, download() will be used
+
+    Returns:
+    The luxcore library
+    """
     pyluxcore = pyluxcore or download()
     pyluxcore.Init(LuxCoreLogHandler)
-    cmd_props = pyluxcore.Properties()
-    cmd_props.Set(pyluxcore.Property("scene.file", scn))
-    cmd_props.Set(pyluxcore.Property("screen.tool.type", "IMAGE_VIEW"))
+    return pyluxcore
+
+
+def properties(txt, pyluxcore=None):
+    """Parses a set of properties from memory, i.e. without files
+
+    Keyword arguments:
+    txt -- The properties, in the same format as the .cfg and .scn files
+    pyluxcore -- The luxcore library. If None, download() will be used
+
+    Returns:
+    The pyluxcore.Properties object
+    """
+    pyluxcore = pyluxcore or download()
+    props = pyluxcore.Properties()
+    props.SetFromString(txt)
+    return props
+
+
+def make_scene(props, meshes, pyluxcore=None):
+    """Builds a scene in memory
+
+    Keyword arguments:
+    props -- The scene pyluxcore.Properties, where the objects are refering
+             to the meshes by their names with the "shape" property
+    meshes -- Dictionary with the mesh names as keys, and tuples of vertices
+              and faces arrays as values
+    pyluxcore -- The luxcore library. If None, download() will be used
+
+    Returns:
+    The pyluxcore.Scene object
+    """
+    pyluxcore = pyluxcore or download()
+    scene = pyluxcore.Scene()
+    for name, (vertices, faces) in meshes.items():
+        # LuxCore is directly reading the NumPy buffers
+        scene.DefineMesh(name,
+                         np.ascontiguousarray(vertices, dtype=np.float32),
+                         np.ascontiguousarray(faces, dtype=np.uint32),
+                         None, None, None, None, None)
+    scene.Parse(props)
+    return scene
+
 
-    os.chdir(folder)
+def run_scene(folder, cfg_props, scene, pyluxcore=None,
+              refresh_interval=2500):
+    """Same than run_sim(), but for the configuration and the scene already
+    built in memory
+
+    Keyword arguments:
+    folder -- The folder where the outputs are written
+    cfg_props -- The render configuration pyluxcore.Properties
+    scene -- The pyluxcore.Scene object. See make_scene()
+    pyluxcore -- The luxcore library. If None, download() will be used
+    refresh_interval -- The screen refresh interval
 
-    cfg_props = pyluxcore.Properties(cfg)
-    cfg_props.Set(cmd_props);
-    config = pyluxcore.RenderConfig(cfg_props)
+    Returns:
+    The started RenderSession
+    """
+    pyluxcore = pyluxcore or download()
+    folder = os.path.abspath(folder)
+    # The film outputs are saved on folder, whatever the current working
+    # directory is
+    cfg_props = absolute_paths(pyluxcore.Properties(cfg_props), folder,
+                               pyluxcore)
 
+    config = pyluxcore.RenderConfig(cfg_props, scene)
     config.Parse(pyluxcore.Properties().Set(
         pyluxcore.Property("screen.refresh.interval", refresh_interval)))
 
     session = pyluxcore.RenderSession(config, None, None)
     session.Start()
 
-    global CURRENT_SESSION
-    CURRENT_SESSION = session
+    return RenderSession(session, folder)
+
 
-    return session
+def edit_scene(session, props):
+    """Modifies the scene of a running session, which is restarted
 
+    Keyword arguments:
+    session -- The render session
+    props -- The pyluxcore.Properties to be parsed on the scene
+    """
+    session.BeginSceneEdit()
+    session.GetRenderConfig().GetScene().Parse(props)
+    session.EndSceneEdit()
+
+
+def get_imgs(folder, session=None, buf=None, export=False, pyluxcore=None):
+    """Reads the denoised film of a session straight from memory
 
-def get_imgs(folder, session=CURRENT_SESSION):
+    Keyword arguments:
+    folder -- The folder where the session outputs are written
+    session -- The render session. If None, nothing is read
+    buf -- Preallocated (height, width, 3) np.float32 buffer. If None or if
+           it has not the right shape, a new one is allocated
+    export -- True if the film outputs should be saved on folder as well
+    pyluxcore -- The luxcore library. If None, download() will be used
+
+    Returns:
+    The R, G, B images, which are views of buf. Thus they are overwritten
+    next time the same buffer is used
+    """
     if session is None:
         return None
+    pyluxcore = pyluxcore or download()
+
+    film = session.GetFilm()
+    if export:
+        film.Save()
+
+    shape = (film.GetHeight(), film.GetWidth(), 3)
+    if buf is None or buf.shape != shape or buf.dtype != np.float32:
+        buf = np.empty(shape, dtype=np.float32)
+    film.GetOutputFloat(pyluxcore.FilmOutputType.RGB_IMAGEPIPELINE, buf,
+                        OIDN_PIPELINE)
+    # The film rows are stored bottom to top
+    img = buf[::-1, :, :]
+    return [img[:, :, i] for i in range(3)]
+
 
-    session.GetFilm().Save()
+def get_exr_imgs(folder, fname=OIDN_EXR):
+    """Reads a film previously exported with get_imgs(..., export=True)
 
+    Keyword arguments:
+    folder -- The folder where the session outputs are written
+    fname -- The EXR file name
+
+    Returns:
+    The R, G, B images
+    """
     pt = Imath.PixelType(Imath.PixelType.FLOAT)
-    exr = OpenEXR.InputFile(os.path.join(folder, "oidn.exr"))
+    exr = OpenEXR.InputFile(os.path.join(folder, fname))
     dw = exr.header()['dataWindow']
     size = (dw.max.x - dw.min.x + 1, dw.max.y - dw.min.y + 1)
     imgs = []
@@ -0,0 +1,144 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import time
+from PySide import QtCore
+
+
+# Shortest and longest time between the session polls, in seconds
+MIN_INTERVAL = 0.005
+MAX_INTERVAL = 0.25
+
+
+class Monitor(QtCore.QThread):
+    progress = QtCore.Signal(int, float)
+
+    def __init__(self, session, running=None, min_interval=MIN_INTERVAL,
+                 max_interval=MAX_INTERVAL):
+        """Thread polling a rendering session, emitting its progress. The
+        polling interval adapts to the convergence rate, so the end of the
+        session is detected within milliseconds without busy waiting.
+        QThread.finished is emitted when the session is done or stopped
+
+        Keyword arguments:
+        session -- The LuxCore session, or the Projector one
+        running -- Function returning False when the process is stopped.
+                   None to run until the session is done
+        min_interval -- Shortest time between polls, in seconds
+        max_interval -- Longest time between polls, in seconds
+        """
+        super().__init__()
+        self.session = session
+        self.running = running or (lambda: True)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.last = None
+        self.stopped = False
+        self.error = None
+
+    def __next_interval(self, conv):
+        # Poll faster as the remaining time estimation gets shorter
+        now = time.monotonic()
+        if self.last is None:
+            interval = self.min_interval
+        else:
+            t0, c0 = self.last
+            rate = (conv - c0) / (now - t0) if now > t0 else 0.0
+            if rate > 0.0:
+                interval = 0.25 * (1.0 - conv) / rate
+            else:
+                interval = 2.0 * self.interval
+        self.last = (now, conv)
+        self.interval = min(max(interval, self.min_interval),
+                            self.max_interval)
+        return self.interval
+
+    def run(self):
+        try:
+            self.__poll()
+        except Exception as e:
+            # It is raised again by wait(), on the calling thread
+            self.error = e
+
+    def __poll(self):
+        while not self.session.HasDone():
+            if not self.running():
+                self.stopped = True
+                return
+            self.session.UpdateStats()
+            stats = self.session.GetStats()
+            step = stats.Get("stats.renderengine.pass").GetInt()
+            conv = stats.Get("stats.renderengine.convergence").GetFloat()
+            self.progress.emit(step, conv)
+            self.msleep(int(1000 * self.__next_interval(conv)))
+
+
+class Relay(QtCore.QObject):
+    def __init__(self, func):
+        """Calls a function on the thread the relay was created in, which
+        is not granted for plain Python functions connected to signals
+
+        Keyword arguments:
+        func -- The function
+        """
+        super().__init__()
+        self.func = func
+
+    @QtCore.Slot(int, float)
+    def call(self, step, conv):
+        self.func(step, conv)
+
+
+def wait(session, on_progress=None, running=None):
+    """Waits for a session to finish, processing the GUI events meanwhile
+
+    Keyword arguments:
+    session -- The LuxCore session, or the Projector one
+    on_progress -- Function called with the session pass and convergence
+                   on the main thread. None to ignore the progress
+    running -- Function returning False when the process is stopped
+
+    Returns:
+    False if the process was stopped, True otherwise. The errors polling
+    the session, like a crashed render process, are raised
+    """
+    monitor = Monitor(session, running=running)
+    if QtCore.QCoreApplication.instance() is None:
+        # Without an event loop, like in FreeCADCmd, just poll here
+        if on_progress is not None:
+            monitor.progress.connect(on_progress)
+        monitor.run()
+        if monitor.error is not None:
+            raise monitor.error
+        return not monitor.stopped
+    if on_progress is not None:
+        relay = Relay(on_progress)
+        monitor.progress.connect(relay.call, QtCore.Qt.QueuedConnection)
+    loop = QtCore.QEventLoop()
+    monitor.finished.connect(loop.quit)
+    monitor.start()
+    loop.exec_()
+    monitor.wait()
+    if monitor.error is not None:
+        raise monitor.error
+    return not monitor.stopped
@@ -0,0 +1,133 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import os
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+from . import Cache
+
+
+# Bump it whenever the reconstruction plans change
+CACHE_VERSION = 1
+# Maximum size of the cache, in bytes
+MAX_SIZE = 2 * 1024 * 1024 * 1024
+
+
+def folder(path=None):
+    """Returns the folder where the reconstruction plans are stored,
+    creating it if it does not exist yet
+
+    Keyword arguments:
+    path -- The parent folder. If None, App.getUserAppDataDir() will be used
+
+    Returns:
+    The cache folder
+    """
+    if path is None:
+        # The plans are used on worker processes, which might not need
+        # FreeCAD at all when the folder is given
+        import FreeCAD as App
+        path = App.getUserAppDataDir()
+    path = os.path.join(path, 'XRay', 'plan_cache')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def digest(angles, n_det, geometry='Parallel'):
+    """Hash of the parameters a reconstruction plan depends on
+
+    Keyword arguments:
+    angles -- The projection angles, in degrees
+    n_det -- Number of detector pixels
+    geometry -- The emitter type
+
+    Returns:
+    The hexadecimal hash string
+    """
+    h = hashlib.sha1()
+    h.update('{}:{}:{}'.format(CACHE_VERSION, n_det, geometry).encode())
+    h.update(np.asarray(angles, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def load(key, path=None):
+    """Get the folder of a cached plan
+
+    Keyword arguments:
+    key -- The digest() of the plan parameters
+    path -- The cache parent folder. See folder()
+
+    Returns:
+    The plan folder, None if it is not cached
+    """
+    path = folder(path)
+    if Cache.lookup(path, key) is None:
+        return None
+    return Cache.entry(path, key)
+
+
+def __size(folder):
+    return sum([os.path.getsize(os.path.join(folder, f))
+                for f in os.listdir(folder)])
+
+
+def store(key, plan, path=None, max_size=MAX_SIZE):
+    """Add a plan to the cache, evicting the least recently used ones if
+    the cache grows too large
+
+    Keyword arguments:
+    key -- The digest() of the plan parameters
+    plan -- The plan, which should have a save(folder) method. Its folder
+            is set to the cached one
+    path -- The cache parent folder. See folder()
+    max_size -- The maximum size of the cache, in bytes
+    """
+    path = folder(path)
+    # The plan is saved on a private folder which is renamed afterwards, so
+    # other processes never find it half written
+    tmp = tempfile.mkdtemp(dir=path, prefix=key + '.', suffix='.tmp')
+    plan.save(tmp)
+    dst = Cache.entry(path, key)
+    try:
+        os.rename(tmp, dst)
+    except OSError:
+        # Another process already stored it, so that one is used instead
+        shutil.rmtree(tmp, ignore_errors=True)
+    plan.folder = dst
+    try:
+        size = __size(dst)
+    except OSError:
+        # It was evicted meanwhile, so the plan is just kept in memory
+        plan.folder = None
+        return
+    Cache.add(path, key, {'size': size}, max_size=max_size)
+
+
+def clear(path=None):
+    """Remove all the cached plans
+
+    Keyword arguments:
+    path -- The cache parent folder. See folder()
+    """
+    Cache.clear(folder(path))
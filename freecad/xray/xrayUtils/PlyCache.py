@@ -0,0 +1,147 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from . import Cache, Files
+
+
+# Bump it whenever the way the PLY files are generated changes
+CACHE_VERSION = 1
+# Maximum size of the cache, in bytes
+MAX_SIZE = 512 * 1024 * 1024
+SUFFIX = ".ply"
+
+
+def folder(path=None):
+    """Returns the folder where the cached PLY files are stored, creating it
+    if it does not exist yet
+
+    Keyword arguments:
+    path -- The parent folder. If None, App.getUserAppDataDir() will be used
+
+    Returns:
+    The cache folder
+    """
+    if path is None:
+        import FreeCAD as App
+        path = App.getUserAppDataDir()
+    path = os.path.join(path, 'XRay', 'ply_cache')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def export_settings():
+    """Returns the settings the shapes are tessellated with when they are
+    exported as meshes
+
+    Returns:
+    Dictionary of JSON serializable settings
+    """
+    import FreeCAD as App
+    grp = App.ParamGet("User parameter:BaseApp/Preferences/Mod/Mesh")
+    return {'deviation': grp.GetFloat("MaxDeviationExport", 0.1)}
+
+
+def digest(obj, scale='', tessellation=None):
+    """Content hash of an object geometry, including its placement
+
+    Keyword arguments:
+    obj -- A mesh object, a shape object or a shape
+    scale -- The length units the PLY is exported in
+    tessellation -- The shapes tessellation settings. None for the current
+                    ones, see export_settings(). Meshes are not tessellated
+
+    Returns:
+    The hexadecimal hash string
+    """
+    h = hashlib.sha1()
+    h.update('{}:{}'.format(CACHE_VERSION, scale).encode())
+    if hasattr(obj, 'Mesh'):
+        points, facets = obj.Mesh.Topology
+        h.update(np.array([[p.x, p.y, p.z] for p in points],
+                          dtype=np.float64).tobytes())
+        h.update(np.array(facets, dtype=np.int64).tobytes())
+        h.update(np.array(obj.Mesh.Placement.toMatrix().A,
+                          dtype=np.float64).tobytes())
+    else:
+        shape = getattr(obj, 'Shape', obj)
+        h.update(shape.exportBrepToString().encode())
+        if tessellation is None:
+            tessellation = export_settings()
+        h.update(json.dumps(tessellation, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def load(key, fname, path=None):
+    """Copy a cached PLY file
+
+    Keyword arguments:
+    key -- The digest() of the exported object
+    fname -- The destination file
+    path -- The cache parent folder. See folder()
+
+    Returns:
+    The area of the mesh, None if it is not cached
+    """
+    path = folder(path)
+    data = Cache.lookup(path, key, SUFFIX)
+    if data is None:
+        return None
+    try:
+        shutil.copyfile(Cache.entry(path, key, SUFFIX), fname)
+    except OSError:
+        # Evicted meanwhile
+        return None
+    return data['area']
+
+
+def store(key, fname, area, path=None, max_size=MAX_SIZE):
+    """Add a PLY file to the cache, evicting the least recently used ones
+    if the cache grows too large
+
+    Keyword arguments:
+    key -- The digest() of the exported object
+    fname -- The exported PLY file
+    area -- The mesh area
+    path -- The cache parent folder. See folder()
+    max_size -- The maximum size of the cache, in bytes
+    """
+    path = folder(path)
+    with Files.atomic_file(Cache.entry(path, key, SUFFIX)) as f:
+        with open(fname, 'rb') as src:
+            shutil.copyfileobj(src, f)
+    Cache.add(path, key, {'area': float(area),
+                          'size': os.path.getsize(fname)},
+              SUFFIX, max_size)
+
+
+def clear(path=None):
+    """Remove all the cached files
+
+    Keyword arguments:
+    path -- The cache parent folder. See folder()
+    """
+    Cache.clear(folder(path), SUFFIX)
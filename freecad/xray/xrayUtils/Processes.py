@@ -0,0 +1,60 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+# The multiprocessing setup shared by the pools and processes of the
+# workbench. This module is imported by the child processes, so it must not
+# depend on FreeCAD or the GUI
+
+
+import os
+import sys
+import multiprocessing
+
+
+def python_executable():
+    """Returns the Python interpreter to launch the workers with. Within
+    FreeCAD sys.executable is the FreeCAD binary itself, so the bundled
+    interpreter is looked for next to it
+
+    Returns:
+    The interpreter path
+    """
+    exe = sys.executable
+    if not os.path.basename(exe).lower().startswith('freecad'):
+        return exe
+    folder = os.path.dirname(exe)
+    for name in ('python', 'python3', 'python.exe'):
+        if os.path.isfile(os.path.join(folder, name)):
+            return os.path.join(folder, name)
+    return exe
+
+
+def context():
+    """Returns the multiprocessing context to create the pools with. The
+    workers are spawned, since neither FreeCAD nor LuxCore are fork safe
+
+    Returns:
+    The multiprocessing context
+    """
+    ctx = multiprocessing.get_context('spawn')
+    ctx.set_executable(python_executable())
+    return ctx
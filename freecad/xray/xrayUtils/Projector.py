@@ -0,0 +1,317 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import numpy as np
+
+
+# Maximum number of ray-triangle pairs tested at once
+CHUNK_SIZE = 2**20
+# Maximum number of triangles on the BVH leaves
+LEAF_SIZE = 8
+EPSILON = 1e-12
+# Tolerances of the bounding boxes (relative to the mesh size), the
+# barycentric coordinates and the ray parameter of the hits
+EPSILON_BOX = 1e-9
+EPSILON_UV = 1e-9
+EPSILON_T = 1e-9
+
+
+def detector(distance, width, height, res_x, res_y):
+    """Returns the detector pixel centers, for a machine at angle 0
+
+    Keyword arguments:
+    distance -- Distance between the emitter and the detector
+    width -- Horizontal size of the detector
+    height -- Vertical size of the detector
+    res_x -- Horizontal detector resolution
+    res_y -- Vertical detector resolution
+
+    Returns:
+    The (res_y * res_x, 3) array of pixel centers, row by row starting from
+    the top one, as the LuxCore films are read
+    """
+    y = ((np.arange(res_x) + 0.5) / res_x - 0.5) * width
+    z = (0.5 - (np.arange(res_y) + 0.5) / res_y) * height
+    yy, zz = np.meshgrid(y, z)
+    xx = np.full(yy.shape, 0.5 * distance)
+    return np.stack((xx, yy, zz), axis=-1).reshape(-1, 3)
+
+
+def rotation(angle):
+    """Returns the rotation of the machine around the z axis, counter
+    clockwise like FreeCAD's Placement.Rotation
+
+    Keyword arguments:
+    angle -- The rotation angle, in radians
+
+    Returns:
+    The (4, 4) homogeneous transformation matrix
+    """
+    c, s = np.cos(angle), np.sin(angle)
+    return np.array([[c, -s, 0.0, 0.0],
+                     [s, c, 0.0, 0.0],
+                     [0.0, 0.0, 1.0, 0.0],
+                     [0.0, 0.0, 0.0, 1.0]])
+
+
+def rays(emitter_type, distance, width, height, res_x, res_y, angle=0.0):
+    """Returns the rays traced from the emitter to each detector pixel
+
+    Keyword arguments:
+    emitter_type -- One of Instance.EMITTER_TYPES
+    distance -- Distance between the emitter and the detector
+    width -- Horizontal size of the detector
+    height -- Vertical size of the detector
+    res_x -- Horizontal detector resolution
+    res_y -- Vertical detector resolution
+    angle -- Rotation of the machine around the z axis, in radians
+
+    Returns:
+    The origins and the directions of the rays. The directions are not
+    normalized, but they are the vectors from the emitter to the pixels
+    """
+    targets = detector(distance, width, height, res_x, res_y)
+    origins = np.zeros(targets.shape, dtype=targets.dtype)
+    origins[:, 0] = -0.5 * distance
+    if emitter_type == 'Parallel':
+        origins[:, 1:] = targets[:, 1:]
+    elif emitter_type == 'Helical':
+        origins[:, 2] = targets[:, 2]
+    elif emitter_type != 'Cone':
+        raise ValueError('Unknown emitter type "{}"'.format(emitter_type))
+
+    rot = rotation(angle)[:3, :3]
+    origins = origins @ rot.T
+    targets = targets @ rot.T
+    return origins, targets - origins
+
+
+class BVH:
+    def __init__(self, vertices, faces, leaf_size=LEAF_SIZE):
+        """Bounding volume hierarchy of a triangle mesh, so each ray is just
+        tested against the triangles it might hit
+
+        Keyword arguments:
+        vertices -- (m, 3) array of mesh vertices
+        faces -- (k, 3) array of triangle vertex indexes
+        leaf_size -- Maximum number of triangles of the leaf nodes
+        """
+        self.vertices = np.asarray(vertices, dtype=np.float64)
+        self.faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+        self.leaf_size = leaf_size
+        tris = self.vertices[self.faces]
+        t_lo, t_hi = tris.min(axis=1), tris.max(axis=1)
+        centers = tris.mean(axis=1)
+        # The boxes are slightly inflated, so the rays grazing them are not
+        # missed due to the round off errors
+        margin = EPSILON_BOX * max(np.ptp(self.vertices, axis=0).max(), 1.0) \
+            if len(self.vertices) else 0.0
+        self.order = np.arange(len(self.faces))
+        lo, hi, left, start, count = [], [], [], [], []
+
+        def new_node():
+            lo.append(None)
+            hi.append(None)
+            left.append(-1)
+            start.append(0)
+            count.append(0)
+            return len(lo) - 1
+
+        stack = [(new_node(), 0, len(self.faces))]
+        while stack:
+            node, i0, i1 = stack.pop()
+            idx = self.order[i0:i1]
+            lo[node] = t_lo[idx].min(axis=0) - margin if len(idx) else \
+                np.full(3, np.inf)
+            hi[node] = t_hi[idx].max(axis=0) + margin if len(idx) else \
+                np.full(3, -np.inf)
+            if i1 - i0 <= leaf_size:
+                start[node], count[node] = i0, i1 - i0
+                continue
+            # Median split along the largest extent of the centers
+            c = centers[idx]
+            axis = np.argmax(c.max(axis=0) - c.min(axis=0))
+            mid = (i1 - i0) // 2
+            self.order[i0:i1] = idx[np.argpartition(c[:, axis], mid)]
+            # The children are always consecutive nodes
+            left[node] = new_node()
+            new_node()
+            stack += [(left[node], i0, i0 + mid),
+                      (left[node] + 1, i0 + mid, i1)]
+        self.lo = np.asarray(lo)
+        self.hi = np.asarray(hi)
+        self.left = np.asarray(left, dtype=np.int64)
+        self.start = np.asarray(start, dtype=np.int64)
+        self.count = np.asarray(count, dtype=np.int64)
+
+    def candidates(self, origins, directions):
+        """Traverses the hierarchy with a set of ray segments, all at once
+
+        Keyword arguments:
+        origins -- (n, 3) array of ray origins
+        directions -- (n, 3) array of ray segments
+
+        Returns:
+        The ray and triangle indexes of the pairs to be tested
+        """
+        d = np.where(directions == 0.0, EPSILON, directions)
+        inv = 1.0 / d
+        rays = np.arange(len(origins))
+        nodes = np.zeros(len(origins), dtype=np.int64)
+        pairs_r, pairs_t = [], []
+        while len(rays):
+            o, i = origins[rays], inv[rays]
+            t0 = (self.lo[nodes] - o) * i
+            t1 = (self.hi[nodes] - o) * i
+            t_in = np.max(np.minimum(t0, t1), axis=1)
+            t_out = np.min(np.maximum(t0, t1), axis=1)
+            hit = (t_out >= np.maximum(t_in, 0.0)) & (t_in <= 1.0)
+            rays, nodes = rays[hit], nodes[hit]
+            leaf = self.left[nodes] < 0
+            r, n = rays[leaf], nodes[leaf]
+            counts = self.count[n]
+            first = np.repeat(np.cumsum(counts) - counts, counts)
+            offsets = np.arange(counts.sum()) - first
+            pairs_r.append(np.repeat(r, counts))
+            pairs_t.append(self.order[np.repeat(self.start[n], counts) +
+                                      offsets])
+            rays, nodes = rays[~leaf], self.left[nodes[~leaf]]
+            rays = np.concatenate((rays, rays))
+            nodes = np.concatenate((nodes, nodes + 1))
+        if not pairs_r:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(pairs_r), np.concatenate(pairs_t)
+
+
+def __intersect(origins, directions, v0, e1, e2):
+    # Möller-Trumbore, vectorized for ray-triangle pairs. The edges are
+    # inclusive, so the hits on shared edges and vertexes are duplicated
+    p = np.cross(directions, e2)
+    det = np.einsum('ij,ij->i', p, e1)
+    valid = np.abs(det) > EPSILON
+    inv_det = np.where(valid, 1.0 / np.where(valid, det, 1.0), 0.0)
+    tvec = origins - v0
+    u = np.einsum('ij,ij->i', tvec, p) * inv_det
+    q = np.cross(tvec, e1)
+    v = np.einsum('ij,ij->i', directions, q) * inv_det
+    t = np.einsum('ij,ij->i', e2, q) * inv_det
+    hit = valid & (u >= -EPSILON_UV) & (v >= -EPSILON_UV) & \
+          (u + v <= 1.0 + EPSILON_UV) & (t >= 0.0) & (t <= 1.0)
+    # det > 0 means that the ray is entering the mesh
+    return hit, t, np.sign(det)
+
+
+def path_lengths(origins, directions, vertices, faces, chunk_size=CHUNK_SIZE,
+                 bvh=None):
+    """Computes the length of each ray segment inside a closed triangle mesh.
+
+    The mesh shall be watertight and with the normals pointing outwards. Each
+    ray-triangle intersection adds (exiting) or subtracts (entering) its
+    distance to the origin, so the result is the total length inside the
+    mesh, no matter how many times the ray crosses it. The crossings through
+    shared edges and vertexes are just counted once.
+
+    Keyword arguments:
+    origins -- (n, 3) array of ray origins
+    directions -- (n, 3) array of ray segments, i.e. from the origin to the
+                  end point
+    vertices -- (m, 3) array of mesh vertices
+    faces -- (k, 3) array of triangle vertex indexes
+    chunk_size -- Maximum number of ray-triangle pairs tested at once
+    bvh -- The BVH of the mesh, so it can be reused for several sets of
+           rays. None to build it
+
+    Returns:
+    The (n,) array of lengths
+    """
+    origins = np.asarray(origins, dtype=np.float64)
+    directions = np.asarray(directions, dtype=np.float64)
+    bvh = bvh or BVH(vertices, faces)
+    v0 = bvh.vertices[bvh.faces[:, 0]]
+    e1 = bvh.vertices[bvh.faces[:, 1]] - v0
+    e2 = bvh.vertices[bvh.faces[:, 2]] - v0
+
+    hits_r, hits_t, hits_s = [], [], []
+    # Each ray is expected to reach a few leaves
+    step = max(1, chunk_size // (16 * bvh.leaf_size))
+    for i0 in range(0, len(origins), step):
+        rays, tris = bvh.candidates(origins[i0:i0 + step],
+                                    directions[i0:i0 + step])
+        for j0 in range(0, len(rays), chunk_size):
+            r, k = rays[j0:j0 + chunk_size], tris[j0:j0 + chunk_size]
+            hit, t, sign = __intersect(origins[i0 + r], directions[i0 + r],
+                                       v0[k], e1[k], e2[k])
+            hits_r.append(i0 + r[hit])
+            hits_t.append(t[hit])
+            hits_s.append(sign[hit])
+
+    t_param = np.zeros(len(origins), dtype=np.float64)
+    if hits_r:
+        r, t, sign = [np.concatenate(h) for h in (hits_r, hits_t, hits_s)]
+        # A crossing through a shared edge or vertex hits several triangles
+        # at the same distance, in the same direction. Just one is kept
+        order = np.lexsort((t, sign, r))
+        r, t, sign = r[order], t[order], sign[order]
+        dup = np.zeros(len(r), dtype=bool)
+        dup[1:] = (r[1:] == r[:-1]) & (sign[1:] == sign[:-1]) & \
+                  (t[1:] - t[:-1] <= EPSILON_T)
+        keep = ~dup
+        t_param = np.bincount(r[keep], weights=-sign[keep] * t[keep],
+                              minlength=len(origins))
+    return np.maximum(t_param, 0.0) * np.linalg.norm(directions, axis=1)
+
+
+def transmission(lengths, mu):
+    """Beer-Lambert transmitted intensity ratio
+
+    Keyword arguments:
+    lengths -- List of path length arrays, one per object
+    mu -- List of linear attenuation coefficients, one per object
+
+    Returns:
+    The I / I0 array
+    """
+    tau = np.zeros(lengths[0].shape, dtype=np.float64) if lengths else 0.0
+    for l, m in zip(lengths, mu):
+        tau = tau + m * l
+    return np.exp(-tau)
+
+
+class Session:
+    def __init__(self, imgs):
+        """Already finished render session, exposing the bits of
+        pyluxcore.RenderSession that the tools are using, so the native
+        projections can be consumed the same way the LuxCore ones are.
+
+        Keyword arguments:
+        imgs -- List of rendered images (R, G, B)
+        """
+        self.imgs = imgs
+
+    def HasDone(self):
+        return True
+
+    def Stop(self):
+        pass
+
+    def get_imgs(self):
+        return self.imgs
@@ -0,0 +1,286 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+# The very same scene rendered by several processes with different seeds,
+# whose films are merged. This module is imported by the render processes,
+# so it must not depend on the GUI.
+#
+# The merged image is the one of the denoised pipeline, the same a single
+# session outputs, see LuxCore.get_imgs(). The render error is estimated
+# from the spread of the raw films instead, since the denoised ones are
+# smoothed, and thus they are closer to each other than the actual noise.
+# The session stops when the root mean square over the pixels of the
+# merged raw film standard error falls below max_error. That is in the
+# same radiance units than LuxCore's batch.haltthreshold, which is the one
+# Radiography computes from the machine error and power, but LuxCore
+# bounds its own per pixel noise estimation instead. Thus the seed split
+# renders converge on average to the same error, while a few noisy pixels
+# might be above it
+
+
+import os
+import queue
+import numpy as np
+from . import Processes
+
+
+# Seconds between the film reports of the render processes
+REPORT_INTERVAL = 1.0
+# The image pipeline without denoising, used to estimate the error
+RAW_PIPELINE = 0
+# Seconds to wait for the render processes to exit before killing them
+JOIN_TIMEOUT = 5.0
+
+
+def render(folder, seed, threads, films, stop, interval=REPORT_INTERVAL):
+    """Render process, periodically reporting its film until it is stopped
+
+    Keyword arguments:
+    folder -- The folder where the scene was exported, see start()
+    seed -- The render engine seed
+    threads -- Number of LuxCore threads
+    films -- Queue where the (seed, samples, raw, denoised) films are
+             reported
+    stop -- Event to stop the rendering
+    interval -- Seconds between the film reports
+    """
+    from . import LuxCore
+    pyluxcore = LuxCore.init()
+    props = pyluxcore.Properties()
+    props.Set(pyluxcore.Property("renderengine.seed", seed))
+    props.Set(pyluxcore.Property("native.threads.count", threads))
+    # The halt condition is evaluated on the merged films
+    props.Set(pyluxcore.Property("batch.haltthreshold.stoprendering.enable",
+                                 0))
+    session = LuxCore.run_sim(folder, pyluxcore=pyluxcore, props=props)
+    # Do not hang at exit if the films were not consumed
+    films.cancel_join_thread()
+    raw = buf = None
+    try:
+        while not stop.wait(interval):
+            session.UpdateStats()
+            stats = session.GetStats()
+            samples = stats.Get(
+                "stats.renderengine.total.samplecount").GetFloat()
+            if samples <= 0:
+                continue
+            film = session.GetFilm()
+            shape = (film.GetHeight(), film.GetWidth(), 3)
+            if buf is None or buf.shape != shape:
+                raw = np.empty(shape, dtype=np.float32)
+                buf = np.empty(shape, dtype=np.float32)
+            film.GetOutputFloat(pyluxcore.FilmOutputType.RGB_IMAGEPIPELINE,
+                                raw, RAW_PIPELINE)
+            film.GetOutputFloat(pyluxcore.FilmOutputType.RGB_IMAGEPIPELINE,
+                                buf, LuxCore.OIDN_PIPELINE)
+            films.put((seed, samples, raw.copy(), buf.copy()))
+    finally:
+        session.Stop()
+
+
+def merge(films):
+    """Merges independent films of the same scene, weighting them with
+    their number of samples
+
+    Keyword arguments:
+    films -- List of (samples, film) tuples
+
+    Returns:
+    The merged film, and the root mean square of its pixels standard error.
+    The error is estimated from the spread of the films, so it is infinite
+    if there are less than 2 of them
+    """
+    n = np.asarray([samples for samples, _ in films], dtype=np.float64)
+    imgs = np.asarray([img for _, img in films], dtype=np.float64)
+    w = n.reshape((-1,) + (1,) * (imgs.ndim - 1))
+    img = np.sum(w * imgs, axis=0) / np.sum(n)
+    if len(films) < 2:
+        return img.astype(np.float32), np.inf
+    # The films variance goes as 1 / samples, so the spread of the weighted
+    # deviations estimates the variance of a single sample
+    var = np.sum(w * (imgs - img)**2, axis=0) / ((len(films) - 1) * np.sum(n))
+    return img.astype(np.float32), float(np.sqrt(np.mean(var)))
+
+
+class Value:
+    def __init__(self, value):
+        """A statistic, with the pyluxcore.Property getters"""
+        self.value = value
+
+    def GetInt(self):
+        return int(self.value)
+
+    def GetFloat(self):
+        return float(self.value)
+
+
+class Stats:
+    def __init__(self, values):
+        """The session statistics, with the pyluxcore.Properties getter
+
+        Keyword arguments:
+        values -- Dictionary of statistics
+        """
+        self.values = values
+
+    def Get(self, name):
+        return Value(self.values[name])
+
+
+class Session:
+    def __init__(self, folder, seeds, max_error, threads=0,
+                 interval=REPORT_INTERVAL):
+        """Render session split in several processes, each one rendering
+        the same scene with a different seed. It exposes the bits of
+        pyluxcore.RenderSession that the tools are using. The session is
+        done when the error of the merged film is below max_error
+
+        Keyword arguments:
+        folder -- The folder where the scene was exported, see start()
+        seeds -- Number of render processes, at least 2
+        max_error -- The admissible root mean square of the pixels standard
+                     error, in the same units than batch.haltthreshold (see
+                     the module notes). 0 to render until the session is
+                     stopped
+        threads -- LuxCore threads of each process, 0 to split all the
+                   cores among the processes
+        interval -- Seconds between the film reports of the processes
+        """
+        ctx = Processes.context()
+        self.folder = folder
+        self.max_error = max_error
+        self.films = {}
+        self.img = None
+        self.error = np.inf
+        self.done = False
+        threads = threads or max(1, (os.cpu_count() or 1) // seeds)
+        self.queue = ctx.Queue()
+        self.stop = ctx.Event()
+        self.processes = [ctx.Process(
+            target=render, daemon=True,
+            args=(folder, seed, threads, self.queue, self.stop, interval))
+            for seed in range(1, seeds + 1)]
+        for p in self.processes:
+            p.start()
+
+    def __drain(self):
+        updated = False
+        while True:
+            try:
+                seed, samples, raw, img = self.queue.get_nowait()
+            except queue.Empty:
+                return updated
+            self.films[seed] = (samples, raw, img)
+            updated = True
+
+    def __merge(self):
+        films = list(self.films.values())
+        self.img, _ = merge([(samples, img) for samples, _, img in films])
+        _, self.error = merge([(samples, raw) for samples, raw, _ in films])
+
+    def HasDone(self):
+        return self.done
+
+    def UpdateStats(self):
+        if self.done or not self.__drain():
+            for p in self.processes:
+                if p.exitcode not in (None, 0):
+                    raise RuntimeError(
+                        'Render process failed with code {}'.format(
+                            p.exitcode))
+            return
+        self.__merge()
+        if len(self.films) == len(self.processes) and \
+                self.error <= self.max_error:
+            self.done = True
+            self.stop.set()
+
+    def GetStats(self):
+        samples = sum([s for s, _, _ in self.films.values()])
+        pixels = self.img[:, :, 0].size if self.img is not None else 1
+        if self.done:
+            conv = 1.0
+        elif self.max_error > 0.0 and np.isfinite(self.error):
+            # The error goes as 1 / sqrt(samples)
+            conv = min((self.max_error / self.error)**2, 1.0)
+        else:
+            conv = 0.0
+        return Stats({'stats.renderengine.pass': samples // pixels,
+                      'stats.renderengine.convergence': conv,
+                      'stats.renderengine.total.samplecount': samples})
+
+    def Stop(self):
+        self.stop.set()
+        self.__drain()
+        for p in self.processes:
+            p.join(JOIN_TIMEOUT)
+            if p.is_alive():
+                p.terminate()
+        if self.__drain():
+            self.__merge()
+
+    def get_imgs(self, buf=None):
+        """Reads the merged film
+
+        Keyword arguments:
+        buf -- Preallocated (height, width, 3) np.float32 buffer. If None or
+               if it has not the right shape, a new one is allocated
+
+        Returns:
+        The R, G, B images, None if no film was reported yet
+        """
+        if self.img is None:
+            return None
+        if buf is None or buf.shape != self.img.shape or \
+                buf.dtype != np.float32:
+            buf = np.empty(self.img.shape, dtype=np.float32)
+        buf[...] = self.img
+        # The film rows are stored bottom to top
+        img = buf[::-1, :, :]
+        return [img[:, :, i] for i in range(3)]
+
+
+def start(folder, cfg_props, scene, seeds, max_error, threads=0,
+          pyluxcore=None):
+    """Exports a scene and launches its seed split render session
+
+    Keyword arguments:
+    folder -- The folder where the scene is exported
+    cfg_props -- The render configuration pyluxcore.Properties
+    scene -- The pyluxcore.Scene object. See LuxCore.make_scene()
+    seeds -- Number of render processes, at least 2
+    max_error -- The admissible error of the merged film. See Session
+    threads -- LuxCore threads of each process, 0 to split all the cores
+               among the processes
+    pyluxcore -- The luxcore library. If None, LuxCore.download() will be
+                 used
+
+    Returns:
+    The started Session
+    """
+    from . import LuxCore
+    pyluxcore = pyluxcore or LuxCore.download()
+    os.makedirs(folder, exist_ok=True)
+    # The processes cannot share the scene in memory, so it is written as
+    # render.cfg and scene.scn, with the meshes as PLY files
+    pyluxcore.RenderConfig(cfg_props, scene).Export(folder)
+    return Session(folder, seeds, max_error, threads=threads)
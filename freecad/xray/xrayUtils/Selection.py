@@ -21,7 +21,6 @@
 #***************************************************************************
 
 import FreeCAD as App
-import FreeCADGui as Gui
 from FreeCAD import Units
 import sys
 
@@ -47,6 +46,8 @@ def get_solids(objs=None):
     The list of objects with solids
     """
     if objs is None:
+        # The GUI is not available on batch mode, where objs is given
+        import FreeCADGui as Gui
         objs = Gui.Selection.getSelection()
     filtered = []
     for obj in objs:
@@ -65,6 +66,8 @@ def get_meshes(objs=None):
     The list of objects with solids
     """
     if objs is None:
+        # The GUI is not available on batch mode, where objs is given
+        import FreeCADGui as Gui
         objs = Gui.Selection.getSelection()
     filtered = []
     for obj in objs:
@@ -86,6 +89,8 @@ def get_xrays(objs=None):
     The list of X-Ray machiness
     """
     if objs is None:
+        # The GUI is not available on batch mode, where objs is given
+        import FreeCADGui as Gui
         objs = Gui.Selection.getSelection()
     filtered = []
     for obj in objs:
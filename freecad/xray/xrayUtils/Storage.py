@@ -0,0 +1,99 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import os
+import numpy as np
+
+
+DTYPES = {'float64': np.float64,
+          'float32': np.float32,
+          'float16': np.float16}
+
+
+def __raw_shape(shape, axes):
+    return tuple([shape[a] for a in axes])
+
+
+def allocate(shape, dtype=np.float32, folder=None, name='data', axes=None):
+    """Allocates a zero initialized array, either in memory or as a memory
+    mapped .npy file
+
+    Keyword arguments:
+    shape -- The array shape
+    dtype -- The data type, or one of the DTYPES keys
+    folder -- The folder where the array file is written. None to keep the
+              array in memory
+    name -- The array file name, without extension
+    axes -- The storage order of the axes, from the slowest varying one to
+            the fastest. e.g. (2, 0, 1) stores contiguously each [:, :, k]
+            slice. None to store them in order
+
+    Returns:
+    The array, with the requested shape regardless the storage order. The
+    .npy file holds the array in storage order, so load() shall be used
+    with the same axes to get it back with the requested shape
+    """
+    dtype = DTYPES.get(dtype, dtype)
+    axes = axes or tuple(range(len(shape)))
+    raw_shape = __raw_shape(shape, axes)
+    if folder is None:
+        raw = np.zeros(raw_shape, dtype=dtype)
+    else:
+        os.makedirs(folder, exist_ok=True)
+        raw = np.lib.format.open_memmap(
+            os.path.join(folder, name + '.npy'), mode='w+', dtype=dtype,
+            shape=raw_shape)
+    return np.transpose(raw, np.argsort(axes))
+
+
+def load(folder, name='data', axes=None, mode='r'):
+    """Memory maps an array previously created with allocate()
+
+    Keyword arguments:
+    folder -- The folder where the array file is written
+    name -- The array file name, without extension
+    axes -- The storage order of the axes, as passed to allocate()
+    mode -- The memory map mode, 'r' for read only or 'r+' for read/write
+
+    Returns:
+    The array, None if the file does not exist
+    """
+    fname = os.path.join(folder, name + '.npy')
+    if not os.path.isfile(fname):
+        return None
+    raw = np.load(fname, mmap_mode=mode)
+    axes = axes or tuple(range(raw.ndim))
+    return np.transpose(raw, np.argsort(axes))
+
+
+def flush(arr):
+    """Writes the pending changes of a memory mapped array on disk. Nothing
+    is done for the arrays in memory
+
+    Keyword arguments:
+    arr -- The array, as returned by allocate() or load()
+    """
+    while arr is not None:
+        if isinstance(arr, np.memmap):
+            arr.flush()
+            return
+        arr = arr.base
@@ -0,0 +1,50 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import numpy as np
+from freecad.xray.xrayUtils import Attenuation
+
+
+# A power law table, which the log-log interpolation reproduces exactly
+ENERGIES = np.array([1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0])
+MU = 3.0e3 * ENERGIES**-2.5
+
+
+def test_table_values():
+    # Degenerated bins just evaluate the interpolation
+    bins = [(e, e) for e in ENERGIES]
+    mu = Attenuation.average(ENERGIES, MU, bins)
+    np.testing.assert_allclose(mu, MU, rtol=1e-12)
+
+
+def test_power_law():
+    e = np.array([1.5, 7.0, 33.0, 80.0])
+    mu = Attenuation.average(ENERGIES, MU, [(x, x, 'extra') for x in e])
+    np.testing.assert_allclose(mu, 3.0e3 * e**-2.5, rtol=1e-12)
+
+
+def test_bin_average():
+    e0, e1 = 10.0, 20.0
+    mu = Attenuation.average(ENERGIES, MU, [(e0, e1)], num=2001)
+    # Analytic average of the power law on the bin
+    exact = 3.0e3 * (e1**-1.5 - e0**-1.5) / (-1.5 * (e1 - e0))
+    np.testing.assert_allclose(mu, [exact], rtol=1e-6)
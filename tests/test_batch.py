@@ -0,0 +1,41 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import os
+import json
+from freecad.xray import Batch
+
+
+def test_json_output(capfd):
+    with Batch.json_output():
+        print('library message')
+        os.write(1, b'native message\n')
+        Batch.report('progress', done=1)
+    out, err = capfd.readouterr()
+    lines = out.splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])['event'] == 'progress'
+    assert 'library message' in err and 'native message' in err
+    # The standard output is restored
+    print('restored')
+    assert capfd.readouterr().out == 'restored\n'
+
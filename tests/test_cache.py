@@ -0,0 +1,60 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import os
+import time
+import multiprocessing
+from freecad.xray.xrayUtils import Cache, Files
+
+
+def store(args):
+    path, key = args
+    with Files.atomic_file(Cache.entry(path, key, '.bin')) as f:
+        f.write(b'x' * 10)
+    Cache.add(path, key, {'size': 10}, '.bin', max_size=1000)
+
+
+def test_concurrent_stores(tmp_path):
+    path = str(tmp_path)
+    keys = ['key{}'.format(i) for i in range(32)]
+    with multiprocessing.get_context('spawn').Pool(4) as pool:
+        pool.map(store, [(path, key) for key in keys])
+    assert sorted(Cache.load_index(path)) == sorted(keys)
+    assert not [f for f in os.listdir(path) if f.endswith('.tmp')]
+
+
+def test_lru_eviction(tmp_path):
+    path = str(tmp_path)
+    for i, key in enumerate(('a', 'b', 'c')):
+        store((path, key))
+        # The modification times are the access times
+        t = time.time() - 100 + i
+        os.utime(Cache.entry(path, key, '.bin'), (t, t))
+    assert Cache.lookup(path, 'a', '.bin') == {'size': 10}
+    with Files.atomic_file(Cache.entry(path, 'd', '.bin')) as f:
+        f.write(b'x' * 10)
+    Cache.add(path, 'd', {'size': 10}, '.bin', max_size=30)
+    assert sorted(Cache.load_index(path)) == ['a', 'c', 'd']
+    assert not os.path.exists(Cache.entry(path, 'b', '.bin'))
+    Cache.clear(path, '.bin')
+    assert Cache.load_index(path) == {}
+    assert Cache.lookup(path, 'a', '.bin') is None
@@ -0,0 +1,85 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import numpy as np
+from freecad.xray.xrayUtils import BackgroundCache, PlyCache
+
+
+COARSE = {'deviation': 0.1}
+FINE = {'deviation': 0.01}
+
+
+class Quantity:
+    def __init__(self, value):
+        self.Value = value
+
+    def getValueAs(self, units):
+        return self
+
+
+class Shape:
+    def exportBrepToString(self):
+        return 'brep'
+
+
+class XRay:
+    EmitterType = 'Cone'
+    EmitterCollimation = Quantity(30.0)
+    ChamberRadius = Quantity(0.5)
+    ChamberHeight = Quantity(1.0)
+    ChamberDistance = Quantity(1.0)
+    SensorResolutionX = 4
+    SensorResolutionY = 3
+
+
+def test_ply_cache(tmp_path):
+    path = str(tmp_path)
+    fname = str(tmp_path / 'shape.ply')
+    with open(fname, 'wb') as f:
+        f.write(b'ply')
+    key = PlyCache.digest(Shape(), 'm', tessellation=COARSE)
+    PlyCache.store(key, fname, 2.0, path=path)
+    out = str(tmp_path / 'out.ply')
+    assert PlyCache.load(PlyCache.digest(Shape(), 'm', tessellation=COARSE),
+                         out, path=path) == 2.0
+    # A different tessellation is a different mesh
+    assert PlyCache.load(PlyCache.digest(Shape(), 'm', tessellation=FINE),
+                         out, path=path) is None
+
+
+def test_background_cache(tmp_path):
+    path = str(tmp_path)
+    power, error = Quantity(10.0), Quantity(0.01)
+    key = BackgroundCache.digest(XRay(), power, error, tessellation=COARSE,
+                                 engine='luxcore')
+    stats = BackgroundCache.stats()
+    BackgroundCache.store(key, np.ones((4, 3)), path=path)
+    img = BackgroundCache.load(
+        BackgroundCache.digest(XRay(), power, error, tessellation=COARSE,
+                               engine='luxcore'), path=path)
+    np.testing.assert_array_equal(img, np.ones((4, 3)))
+    assert BackgroundCache.load(
+        BackgroundCache.digest(XRay(), power, error, tessellation=FINE,
+                               engine='luxcore'), path=path) is None
+    new_stats = BackgroundCache.stats()
+    assert new_stats['hits'] == stats['hits'] + 1
+    assert new_stats['misses'] == stats['misses'] + 1
@@ -0,0 +1,69 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import os
+import numpy as np
+from freecad.xray.xrayUtils import Checkpoint
+from freecad.xray.xrayCT import Reconstruction
+
+
+PARAMS = {'n': 8, 'error': 0.01, 'resolution': [4, 3]}
+
+
+def test_resume(tmp_path):
+    folder = str(tmp_path / 'scan')
+    order = Reconstruction.acquisition_order(8, 'golden')
+    checkpoint = Checkpoint.Checkpoint(folder, PARAMS)
+    assert checkpoint.pending(order) == list(order)
+    assert checkpoint.load_background() is None
+    bkg = np.full((4, 3), 7.0, dtype=np.float32)
+    checkpoint.store_background(bkg)
+    for i in order[:3]:
+        checkpoint.store(i, np.full((4, 3), i, dtype=np.float32))
+
+    # The interrupted scan is resumed, skipping the finished projections
+    resumed = Checkpoint.Checkpoint(folder, PARAMS)
+    assert resumed.pending(order) == list(order[3:])
+    for i in order[:3]:
+        np.testing.assert_array_equal(resumed.load(i), np.full((4, 3), i))
+    # and without rendering the background again
+    assert os.path.isfile(os.path.join(folder, 'background.npy'))
+    np.testing.assert_array_equal(resumed.load_background(), bkg)
+
+
+def test_changed_params(tmp_path):
+    folder = str(tmp_path / 'scan')
+    checkpoint = Checkpoint.Checkpoint(folder, PARAMS)
+    checkpoint.store_background(np.zeros((4, 3)))
+    checkpoint.store(0, np.zeros((4, 3)))
+    restarted = Checkpoint.Checkpoint(folder, dict(PARAMS, error=0.1))
+    assert restarted.pending(range(8)) == list(range(8))
+    assert restarted.load_background() is None
+
+
+def test_remove(tmp_path):
+    folder = str(tmp_path / 'scan')
+    Checkpoint.Checkpoint(folder, PARAMS).store(0, np.zeros((4, 3)))
+    Checkpoint.remove(folder)
+    assert not os.path.exists(folder)
+    # Removing an already removed scan is harmless
+    Checkpoint.remove(folder)
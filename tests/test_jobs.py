@@ -0,0 +1,75 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import time
+import threading
+import multiprocessing
+from freecad.xray import Jobs
+
+
+def add(args):
+    folder, i = args
+    job = {'id': 'job{}'.format(i), 'argv': [], 'state': 'pending',
+           'attempts': 0, 'returncode': None, 'log': None, 'runner': None,
+           'heartbeat': None}
+    Jobs.Queue(folder).update(lambda jobs: jobs.append(job))
+
+
+def test_concurrent_adds_and_claims(tmp_path):
+    folder = str(tmp_path)
+    with multiprocessing.get_context('spawn').Pool(4) as pool:
+        pool.map(add, [(folder, i) for i in range(40)])
+    assert len(Jobs.Queue(folder).reload()) == 40
+
+    claimed = []
+
+    def runner():
+        queue = Jobs.Queue(folder)
+        while True:
+            jobs = queue._Queue__claim(3)
+            if not jobs:
+                return
+            claimed.extend([job['id'] for job in jobs])
+
+    threads = [threading.Thread(target=runner) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(claimed) == sorted(set(claimed))
+    assert len(claimed) == 40
+
+
+def test_resume_stale_jobs(tmp_path):
+    folder = str(tmp_path)
+    add((folder, 0))
+    add((folder, 1))
+    queue = Jobs.Queue(folder)
+
+    def set_running(jobs):
+        jobs[0].update({'state': 'running', 'heartbeat': time.time()})
+        jobs[1].update({'state': 'running',
+                        'heartbeat': time.time() - 2 * Jobs.LEASE})
+    queue.update(set_running)
+    queue.resume()
+    states = [job['state'] for job in queue.reload()]
+    assert states == ['running', 'pending']
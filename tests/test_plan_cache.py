@@ -0,0 +1,54 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import os
+import numpy as np
+from freecad.xray.xrayUtils import PlanCache
+from freecad.xray.xrayCT import Reconstruction
+
+
+ANGLES = np.linspace(0, 180, 12, endpoint=False)
+N_DET = 16
+
+
+def test_store_and_load(tmp_path):
+    key = PlanCache.digest(ANGLES, N_DET)
+    assert PlanCache.load(key, path=str(tmp_path)) is None
+    plan = Reconstruction.Plan(ANGLES, N_DET)
+    PlanCache.store(key, plan, path=str(tmp_path))
+    folder = PlanCache.load(key, path=str(tmp_path))
+    assert folder == plan.folder
+    loaded = Reconstruction.load(folder)
+    np.testing.assert_array_equal(loaded.i0, plan.i0)
+
+
+def test_store_race(tmp_path):
+    # Another process stored the very same plan first
+    key = PlanCache.digest(ANGLES, N_DET)
+    first = Reconstruction.Plan(ANGLES, N_DET)
+    PlanCache.store(key, first, path=str(tmp_path))
+    plan = Reconstruction.Plan(ANGLES, N_DET)
+    PlanCache.store(key, plan, path=str(tmp_path))
+    assert plan.folder == first.folder
+    assert Reconstruction.load(plan.folder) is not None
+    cache = PlanCache.folder(str(tmp_path))
+    assert not [f for f in os.listdir(cache) if f.endswith('.tmp')]
@@ -0,0 +1,119 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import pytest
+import numpy as np
+from freecad.xray.xrayUtils import Projector
+
+
+def box(size):
+    h = 0.5 * size
+    vertices = np.array([[x, y, z] for x in (-h, h) for y in (-h, h)
+                         for z in (-h, h)])
+    # Outwards normals
+    faces = np.array([[0, 1, 3], [0, 3, 2], [4, 6, 7], [4, 7, 5],
+                      [0, 4, 5], [0, 5, 1], [2, 3, 7], [2, 7, 6],
+                      [0, 2, 6], [0, 6, 4], [1, 5, 7], [1, 7, 3]])
+    return vertices, faces
+
+
+def sphere(radius, n_lat=16, n_lon=32):
+    theta = np.linspace(0, np.pi, n_lat + 1)[1:-1]
+    phi = np.linspace(0, 2 * np.pi, n_lon, endpoint=False)
+    tt, pp = np.meshgrid(theta, phi, indexing='ij')
+    vertices = np.stack((np.sin(tt) * np.cos(pp), np.sin(tt) * np.sin(pp),
+                         np.cos(tt)), axis=-1).reshape(-1, 3)
+    vertices = np.concatenate(([[0, 0, 1]], vertices, [[0, 0, -1]]))
+    vertices = radius * vertices
+    top, bottom = 0, len(vertices) - 1
+    ring = lambda i, j: 1 + i * n_lon + j % n_lon
+    faces = []
+    for j in range(n_lon):
+        faces.append([top, ring(0, j), ring(0, j + 1)])
+        faces.append([bottom, ring(n_lat - 2, j + 1), ring(n_lat - 2, j)])
+        for i in range(n_lat - 2):
+            faces.append([ring(i, j), ring(i + 1, j), ring(i + 1, j + 1)])
+            faces.append([ring(i, j), ring(i + 1, j + 1), ring(i, j + 1)])
+    return vertices, np.array(faces)
+
+
+def test_box_axis_rays():
+    vertices, faces = box(0.2)
+    origins = np.array([[-1.0, 0, 0], [0, -1.0, 0], [0, 0, -1.0],
+                        [-1.0, 0.1, 0.1], [-1.0, 0.5, 0]])
+    directions = -2.0 * origins
+    directions[3] = [2.0, 0, 0]
+    directions[4] = [2.0, 0, 0]
+    lengths = Projector.path_lengths(origins, directions, vertices, faces)
+    np.testing.assert_allclose(lengths, [0.2, 0.2, 0.2, 0.2, 0.0],
+                               atol=1e-9)
+
+
+def test_sphere_rays():
+    radius = 0.1
+    vertices, faces = sphere(radius)
+    # Through the poles, and through the center along the equator
+    origins = np.array([[0, 0, -1.0], [-1.0, 0, 0], [-1.0, 0, 0.05]])
+    directions = np.array([[0, 0, 2.0], [2.0, 0, 0], [2.0, 0, 0]])
+    lengths = Projector.path_lengths(origins, directions, vertices, faces)
+    np.testing.assert_allclose(lengths[:2], [0.2, 0.2], atol=1e-9)
+    expected = 2.0 * np.sqrt(radius**2 - 0.05**2)
+    np.testing.assert_allclose(lengths[2], expected, rtol=0.05)
+
+
+def test_bvh_matches_brute_force():
+    vertices, faces = sphere(0.1)
+    rng = np.random.RandomState(0)
+    origins = np.column_stack((np.full(500, -1.0),
+                               rng.uniform(-0.12, 0.12, (500, 2))))
+    directions = np.zeros_like(origins)
+    directions[:, 0] = 2.0
+    lengths = Projector.path_lengths(origins, directions, vertices, faces)
+    single = Projector.path_lengths(origins, directions, vertices, faces,
+                                    bvh=Projector.BVH(vertices, faces,
+                                                      leaf_size=len(faces)))
+    np.testing.assert_allclose(lengths, single, atol=1e-12)
+    r = np.hypot(origins[:, 1], origins[:, 2])
+    assert np.all(lengths[r > 0.1] == 0.0)
+    assert np.all(lengths[r < 0.09] > 0.0)
+
+
+def test_rotation():
+    angle = np.radians(37.0)
+    rot = Projector.rotation(angle)
+    # Counter clockwise around z, like Part.Vertex.rotate()
+    p = rot @ np.array([1.0, 0.0, 0.5, 1.0])
+    np.testing.assert_allclose(p, [np.cos(angle), np.sin(angle), 0.5, 1.0])
+    # LuxCore reads the transformations column-major
+    c, s = np.cos(angle), np.sin(angle)
+    np.testing.assert_allclose(rot.flatten(order='F'),
+                               [c, s, 0, 0, -s, c, 0, 0,
+                                0, 0, 1, 0, 0, 0, 0, 1])
+
+
+def test_rotation_placement():
+    App = pytest.importorskip('FreeCAD')
+    placement = App.Placement(App.Vector(0, 0, 0),
+                              App.Rotation(App.Vector(0, 0, 1), 37.0))
+    mat = np.reshape(placement.Rotation.toMatrix().A, (4, 4))
+    np.testing.assert_allclose(Projector.rotation(np.radians(37.0)), mat,
+                               atol=1e-12)
@@ -0,0 +1,149 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import numpy as np
+import pytest
+from freecad.xray.xrayCT import Reconstruction
+
+
+N_DET = 32
+N_SLICES = 4
+
+
+def phantom(n_det=N_DET, n_slices=N_SLICES):
+    x, y = np.meshgrid(np.arange(n_det), np.arange(n_det), indexing='ij')
+    r = np.hypot(x - 0.5 * n_det + 3, y - 0.5 * n_det)
+    img = np.where(r < 0.25 * n_det, 1.0, 0.0)
+    return np.repeat(img[:, :, np.newaxis], n_slices, axis=2)
+
+
+def sinogram(plan, img):
+    n_det, _, n_slices = img.shape
+    x = img.reshape((n_det * n_det, n_slices))[plan.pixels]
+    sino = plan.matrix() @ x
+    return sino.reshape((len(plan.angles), n_det, n_slices))
+
+
+@pytest.fixture
+def plan():
+    angles = np.linspace(0, 180, 45, endpoint=False)
+    return Reconstruction.Plan(angles, N_DET)
+
+
+def test_lazy_volume_matches_fbp(plan):
+    sino = sinogram(plan, phantom())
+    ct = plan.fbp(sino)
+    volume = Reconstruction.LazyVolume(sino, plan)
+    try:
+        assert volume.shape == ct.shape
+        np.testing.assert_allclose(volume.get_slice(1), ct[:, :, 1],
+                                   atol=1e-5)
+        np.testing.assert_allclose(volume[:, 5, :], ct[:, 5, :], atol=1e-5)
+        np.testing.assert_allclose(np.asarray(volume), ct, atol=1e-5)
+    finally:
+        volume.close()
+
+
+def test_lazy_volume_iterative_cut(plan):
+    sino = sinogram(plan, phantom())
+    volume = Reconstruction.LazyVolume(sino, plan, method='sirt',
+                                       cache_size=2, iterations=5)
+    try:
+        cut = volume.submit_cut(slice(None), 7).result()
+        assert cut.shape == (N_DET, N_SLICES)
+        # The cut slices are not cached
+        assert len(volume.cache) == 0
+        for z in range(N_SLICES):
+            np.testing.assert_allclose(cut[:, z], volume.get_slice(z)[:, 7],
+                                       atol=1e-5)
+    finally:
+        volume.close()
+
+
+def test_fdk_blocks_and_workers():
+    rng = np.random.RandomState(0)
+    sino = rng.rand(24, 20, 13).astype(np.float32)
+    angles = np.linspace(0, 360, 24, endpoint=False)
+    ref = np.concatenate([img for _, _, img in Reconstruction.fdk(
+        sino, angles, 2.0, 1.0, 0.8, block=13)], axis=2)
+    out = np.concatenate([img for _, _, img in Reconstruction.fdk(
+        sino, angles, 2.0, 1.0, 0.8, block=4, workers=3)], axis=2)
+    np.testing.assert_allclose(out, ref, atol=1e-6)
+
+
+def test_streaming_volume_blocks():
+    angles = np.linspace(0, 180, 12, endpoint=False)
+    plan = Reconstruction.Plan(angles, N_DET)
+    rng = np.random.RandomState(1)
+    stream = Reconstruction.Streaming(plan, 5)
+    for i in range(len(angles)):
+        stream.add(i, rng.rand(N_DET, 5))
+    ref = stream.volume(block=5)
+    np.testing.assert_allclose(stream.volume(block=2), ref)
+
+
+@pytest.mark.parametrize('method', ['sirt', 'sart'])
+@pytest.mark.parametrize('noise', [0.0, 0.05])
+def test_tv_does_not_degrade(plan, method, noise):
+    img = phantom()
+    sino = sinogram(plan, img)
+    sino = sino + noise * np.abs(sino).max() * \
+        np.random.RandomState(0).randn(*sino.shape)
+    mask = np.zeros(N_DET * N_DET, dtype=bool)
+    mask[plan.pixels] = True
+
+    def error(tv):
+        out = Reconstruction.iterative(sino, plan, method=method, tv=tv)
+        diff = (out - img).reshape((N_DET * N_DET, N_SLICES))[mask]
+        return np.sqrt(np.mean(diff ** 2))
+
+    ref = error(0.0)
+    for tv in (0.01, 0.1):
+        assert error(tv) <= ref * 1.01
+
+
+@pytest.mark.parametrize('n_det', [33, 64])
+def test_fbp_matches_iradon(n_det):
+    transform = pytest.importorskip('skimage.transform')
+    x, y = np.mgrid[:n_det, :n_det] - n_det // 2
+    img = np.where((x - 3) ** 2 + y ** 2 < (0.3 * n_det) ** 2, 1.0, 0.0)
+    angles = np.linspace(0, 180, 60, endpoint=False)
+    sino = transform.radon(img, angles, circle=True)
+    ref = transform.iradon(sino, angles, circle=True, filter_name='ramp')
+    out = Reconstruction.fbp(sino.T[:, :, np.newaxis], angles)[:, :, 0]
+    # Just the outermost ring differs, if n_det is even
+    inner = x ** 2 + y ** 2 < (n_det // 2 - 1) ** 2
+    np.testing.assert_allclose(out[inner], ref[inner], atol=1e-9)
+    if n_det % 2:
+        np.testing.assert_allclose(out, ref, atol=1e-9)
+
+
+@pytest.mark.parametrize('order', ['golden', 'bit-reversal'])
+@pytest.mark.parametrize('n', [8, 45, 90, 360])
+def test_acquisition_order_prefixes(order, n):
+    indexes = Reconstruction.acquisition_order(n, order)
+    assert sorted(indexes) == list(range(n))
+    for k in range(2, n + 1):
+        # The angles are periodic, so the gap across the end counts too
+        prefix = np.sort(indexes[:k])
+        gaps = np.diff(np.append(prefix, prefix[0] + n))
+        assert gaps.max() <= 2 * n / k
@@ -0,0 +1,53 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import numpy as np
+from freecad.xray.xrayUtils import SeedSplit
+
+
+def test_merge_weights_samples():
+    a = np.full((2, 3, 3), 1.0, dtype=np.float32)
+    b = np.full((2, 3, 3), 5.0, dtype=np.float32)
+    img, error = SeedSplit.merge([(1, a), (3, b)])
+    assert img.dtype == np.float32
+    assert np.allclose(img, (1 * 1.0 + 3 * 5.0) / 4)
+    assert np.isfinite(error)
+
+
+def test_merge_single_film():
+    a = np.random.default_rng(0).random((4, 4, 3)).astype(np.float32)
+    img, error = SeedSplit.merge([(10, a)])
+    assert np.allclose(img, a)
+    assert error == np.inf
+
+
+def test_merge_error():
+    # Films averaging a different number of unit variance samples, so the
+    # merged film standard error is 1 / sqrt(total samples)
+    rng = np.random.default_rng(1)
+    samples = [4, 16, 64, 16]
+    films = [(n, rng.normal(2.0, 1.0 / np.sqrt(n), (200, 200, 3)))
+             for n in samples]
+    img, error = SeedSplit.merge(films)
+    expected = 1.0 / np.sqrt(sum(samples))
+    assert abs(error - expected) < 0.05 * expected
+    assert abs(np.mean(img) - 2.0) < 3 * expected / np.sqrt(img.size)
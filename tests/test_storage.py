@@ -0,0 +1,38 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2021 Jose Luis Cercos Pita <jlcercos@gmail.com>         *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import numpy as np
+from freecad.xray.xrayUtils import Storage
+
+
+def test_storage_order(tmp_path):
+    data = np.arange(60, dtype=np.float32).reshape((3, 4, 5))
+    arr = Storage.allocate(data.shape, folder=str(tmp_path), name='volume',
+                           axes=(2, 0, 1))
+    arr[...] = data
+    Storage.flush(arr)
+    # The file is a stack of [:, :, k] slices
+    raw = np.load(str(tmp_path / 'volume.npy'))
+    assert raw.shape == (5, 3, 4)
+    np.testing.assert_array_equal(raw[2], data[:, :, 2])
+    loaded = Storage.load(str(tmp_path), 'volume', axes=(2, 0, 1))
+    np.testing.assert_array_equal(loaded, data)